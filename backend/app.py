@@ -3,9 +3,31 @@ GCE Erode Exam Seating System - Flask Backend (Supabase Edition)
 Serverless-compatible Flask app for Vercel deployment
 """
 
-from flask import Flask, jsonify, request
+import click
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
+import base64
+import io
+import json
 import os
+import threading
+
+from metrics import init_metrics, render_metrics
+from services.importer import (
+    IMPORT_CHUNK_SIZE,
+    PDF_COLUMNS,
+    import_students,
+    rows_from_csv,
+    rows_from_parsed
+)
+from services.parser import parser_service
+from services.planning import plan_capacity
+from services.registrations import RegistrationMatrix
+from services.export import REPORTS, seat_rows, stream_csv
+from services.logic import group_exam_slots, plan_slots
+from services.seat_plan import EMPTY, SeatPlan
+from services.seating import assign_seats, keep_existing_seats
+from services.validator import describe, status, summarize, validate_plan
 
 # Import Supabase client
 from supabase_client import (
@@ -14,18 +36,50 @@ from supabase_client import (
     get_blocks,
     get_halls,
     get_students,
-    search_student,
-    get_hall_seats,
+    lookup_seat_card,
+    seat_card,
+    seat_cards,
+    warm_seat_cards,
+    get_hall_with_seats,
+    get_halls_with_seats,
     get_stats,
-    allocate_seat,
+    bulk_allocate_seats,
     clear_all_allocations,
     get_exams,
-    get_unique_exam_dates
+    get_unique_exam_dates,
+    invalidate_cache,
+    CACHE_TTL,
+    fetch_all_rows,
+    gather,
+    upsert_students,
+    iter_seat_rows,
+    iter_subject_registrations,
+    replace_allotments
 )
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
+init_metrics(app)
+
+def warm_lookup_cache():
+    """Preload seat cards so hall-ticket lookups skip the database"""
+    try:
+        count = warm_seat_cards()
+        print(f"✅ Warmed seat card cache with {count} students")
+    except Exception as e:
+        print(f"⚠️ Seat card warm-up failed: {e}")
+
+if os.getenv("WARM_SEAT_CARDS", "1") == "1":
+    threading.Thread(target=warm_lookup_cache, daemon=True).start()
+
+def cached_response(payload):
+    """JSON response with ETag/Cache-Control that answers 304 when the client copy is current"""
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.public = True
+    response.cache_control.max_age = CACHE_TTL
+    return response.make_conditional(request)
 
 # ======================= HEALTH CHECK =======================
 
@@ -34,6 +88,11 @@ def health_check():
     """Health check endpoint for Vercel"""
     return jsonify({"status": "ok", "database": "supabase"})
 
+@app.route('/api/metrics')
+def api_metrics():
+    """Request latency, payload size and database call metrics in Prometheus text format"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 # ======================= STATS =======================
 
 @app.route('/api/stats')
@@ -52,7 +111,7 @@ def api_departments():
     """Get all departments"""
     try:
         departments = get_departments()
-        return jsonify({"departments": departments, "count": len(departments)})
+        return cached_response({"departments": departments, "count": len(departments)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -74,7 +133,7 @@ def api_blocks():
                 "color": block["color"],
                 "halls": [h["name"] for h in block.get("halls", [])]
             })
-        return jsonify({"blocks": formatted, "count": len(formatted)})
+        return cached_response({"blocks": formatted, "count": len(formatted)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -97,62 +156,136 @@ def api_halls():
                 "block": block.get("name") if block else None,
                 "blockKey": block.get("key") if block else None
             })
-        return jsonify({"halls": formatted, "count": len(formatted)})
+        return cached_response({"halls": formatted, "count": len(formatted)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def format_seat_maps(halls):
+    """Seat lists for halls fetched with their embedded students, sliced out of one SeatPlan"""
+    plan = SeatPlan.from_halls(halls)
+    return [format_seat_map(hall, plan) for hall in halls]
+
+def format_seat_map(hall, plan):
+    """Build the seat list for one hall of a SeatPlan"""
+    block = hall.get("blocks") or {}
+    position = plan.positions[hall["id"]]
+    
+    seats = []
+    for i, index in enumerate(plan.hall_seats(hall["id"]).tolist()):
+        if index == EMPTY:
+            seats.append({"seatIndex": i, "student": None})
+            continue
+        student_at_seat = plan.students[index]
+        dept = student_at_seat.get("departments", {})
+        seats.append({
+            "seatIndex": i,
+            "student": {
+                "regNo": student_at_seat["reg_no"],
+                "rollNo": student_at_seat["roll_no"],
+                "name": student_at_seat["name"],
+                "department": dept.get("abbr") if dept else "Unknown",
+                "color": dept.get("color", "gray") if dept else "gray"
+            }
+        })
+    
+    return {
+        "hall": hall["name"],
+        "block": block.get("name"),
+        "blockKey": block.get("key"),
+        "capacity": hall["capacity"],
+        "rows": int(plan.rows[position]),
+        "cols": int(plan.cols[position]),
+        "seats": seats
+    }
+
 @app.route('/api/halls/<hall_name>/seats')
 def api_hall_seats(hall_name):
     """Get all seats in a specific hall"""
     try:
-        # First get the hall ID
-        hall_response = supabase.table("halls").select("id, capacity").eq("name", hall_name).single().execute()
-        if not hall_response.data:
+        hall = get_hall_with_seats(hall_name)
+        if not hall:
             return jsonify({"error": "Hall not found"}), 404
         
-        hall = hall_response.data
-        students = get_hall_seats(hall["id"])
-        
-        # Format seats array (0-24 for 5x5 grid)
-        seats = []
-        for i in range(hall["capacity"]):
-            student_at_seat = next((s for s in students if s.get("seat") == i), None)
-            if student_at_seat:
-                dept = student_at_seat.get("departments", {})
-                seats.append({
-                    "seatIndex": i,
-                    "student": {
-                        "regNo": student_at_seat["reg_no"],
-                        "rollNo": student_at_seat["roll_no"],
-                        "name": student_at_seat["name"],
-                        "department": dept.get("abbr") if dept else "Unknown",
-                        "color": dept.get("color", "gray") if dept else "gray"
-                    }
-                })
-            else:
-                seats.append({"seatIndex": i, "student": None})
-        
-        return jsonify({"hall": hall_name, "capacity": hall["capacity"], "seats": seats})
+        return jsonify(format_seat_maps([hall])[0])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/halls/seats')
+def api_all_hall_seats():
+    """Get seat maps for every hall, or one block, e.g. for printing door notices"""
+    block_key = request.args.get('block')
+    try:
+        halls = get_halls_with_seats(block_key)
+        formatted = format_seat_maps(halls)
+        return jsonify({"halls": formatted, "count": len(formatted)})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # ======================= STUDENTS =======================
 
+def encode_cursor(student):
+    """Opaque keyset cursor for the (department_id, id) position of a student row"""
+    raw = json.dumps([student["department_id"], student["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; raises ValueError on a malformed token"""
+    try:
+        dept_id, student_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(dept_id, int) or not isinstance(student_id, int):
+        raise ValueError("Invalid cursor")
+    return dept_id, student_id
+
 @app.route('/api/students')
 def api_students():
-    """Get paginated students list"""
+    """Get students page by page: keyset `cursor` (or legacy `page`) plus server-side filters"""
     year = request.args.get('year', type=int)
     department = request.args.get('department', type=int)
-    page = request.args.get('page', 1, type=int)
-    limit = request.args.get('limit', 50, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
     offset = (page - 1) * limit
+    cursor = request.args.get('cursor')
+    hall_name = request.args.get('hall')
+    date = request.args.get('date')
+    session = request.args.get('session')
+    fields = request.args.get('fields', 'list')
     
     try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # Hall and exam lookups are independent, so a cold cache costs one round trip
+        halls, exams = gather(
+            lambda: get_halls() if hall_name else None,
+            lambda: get_exams(date, session) if date else None,
+        )
+        
+        hall_id = None
+        if hall_name:
+            hall = next((h for h in halls if h["name"] == hall_name), None)
+            if not hall:
+                return jsonify({"error": "Hall not found"}), 404
+            hall_id = hall["id"]
+        
+        exam_ids = None
+        if date:
+            exam_ids = [e["id"] for e in exams]
+        
         students = get_students(
             department_id=department,
             year_of_study=year,
             limit=limit,
-            offset=offset
+            offset=offset,
+            after=after,
+            hall_id=hall_id,
+            exam_ids=exam_ids,
+            roll_prefix=request.args.get('roll'),
+            name=request.args.get('name'),
+            fields=fields
         )
         
         # Format response
@@ -173,7 +306,8 @@ def api_students():
                 "seatLabel": s["seat_label"]
             })
         
-        return jsonify({"students": formatted, "count": len(formatted), "page": page})
+        next_cursor = encode_cursor(students[-1]) if len(students) == limit else None
+        return jsonify({"students": formatted, "count": len(formatted), "page": page, "nextCursor": next_cursor})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -181,34 +315,46 @@ def api_students():
 def api_search(reg_no):
     """Search for a student by registration number"""
     try:
-        student = search_student(reg_no)
-        if not student:
+        card, hit = lookup_seat_card(reg_no)
+        if not card:
             return jsonify({"error": "Student not found"}), 404
         
-        dept = student.get("departments", {})
-        hall = student.get("halls", {})
-        block = hall.get("blocks", {}) if hall else {}
+        response = jsonify(card)
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search/stats')
+def api_search_stats():
+    """Hit/miss counters for the seat card lookup cache"""
+    return jsonify(seat_cards.stats())
+
+@app.route('/api/import/students', methods=['POST'])
+def api_import_students():
+    """Bulk import students from a roster CSV or a nominal-roll PDF"""
+    upload = request.files.get('file')
+    chunk_size = request.args.get('chunk_size', IMPORT_CHUNK_SIZE, type=int)
+    if not upload or not upload.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+    try:
+        # A nominal roll only carries names and subjects; the roster CSV carries everything
+        columns = None
+        if upload.filename.lower().endswith('.pdf'):
+            rows = rows_from_parsed(parser_service.iter_student_list(upload.stream))
+            columns = PDF_COLUMNS
+        else:
+            rows = rows_from_csv(io.TextIOWrapper(upload.stream, encoding="utf-8-sig"))
         
-        row = (student["seat"] // 5) + 1 if student.get("seat") is not None else None
-        col = (student["seat"] % 5) + 1 if student.get("seat") is not None else None
+        report = import_students(rows, get_departments(), upsert_students, chunk_size, columns)
         
-        return jsonify({
-            "regNo": student["reg_no"],
-            "rollNo": student["roll_no"],
-            "name": student["name"],
-            "department": dept.get("abbr") if dept else None,
-            "color": dept.get("color", "gray") if dept else "gray",
-            "yearOfStudy": student["year_of_study"],
-            "hall": hall.get("name") if hall else None,
-            "block": block.get("name") if block else None,
-            "blockKey": block.get("key") if block else None,
-            "seat": student["seat"],
-            "row": row,
-            "col": col,
-            "seatCode": f"R{row}C{col}" if row and col else None
-        })
+        # Names, departments and subjects may have changed
+        invalidate_cache()
+        seat_cards.clear()
+        
+        return jsonify({"status": "success", **report})
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 # ======================= EXAMS =======================
 
@@ -217,7 +363,7 @@ def api_exam_dates():
     """Get unique exam dates for filtering"""
     try:
         dates = get_unique_exam_dates()
-        return jsonify(dates)
+        return cached_response(dates)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -232,21 +378,146 @@ def api_exams():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def load_registrations(slots):
+    """Registration bitset for every subject examined in `slots`"""
+    subject_codes = sorted({e["subject_code"] for exams in slots.values() for e in exams})
+    return RegistrationMatrix(
+        (r["subject_code"], r["student_id"]) for r in iter_subject_registrations(subject_codes)
+    )
+
+@app.route('/api/exams/clashes')
+def api_exam_clashes():
+    """Students registered for more than one exam in the same date/session, per slot"""
+    date = request.args.get('date')
+    session = request.args.get('session')
+    try:
+        slots = group_exam_slots(get_exams(date, session))
+        report = load_registrations(slots).clash_report(slots)
+        return jsonify({
+            "slots": report,
+            "clashes": sum(slot["clashes"] for slot in report)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ======================= EXPORT =======================
+
+@app.route('/api/export/<report>')
+def api_export(report):
+    """Stream seating charts, hall lists or attendance sheets as CSV"""
+    fmt = request.args.get('format', 'csv')
+    slots = request.args.get('mode') == 'slots'
+    date = request.args.get('date')
+    session = request.args.get('session')
+    if report not in REPORTS:
+        return jsonify({"error": f"Unknown report, expected one of {', '.join(REPORTS)}"}), 404
+    if fmt != 'csv':
+        return jsonify({"error": "Only CSV export is supported"}), 400
+    try:
+        halls = {h["id"]: h for h in get_halls()}
+        records = seat_rows(iter_seat_rows(slots, date, session), halls)
+        return Response(
+            stream_with_context(stream_csv(report, records)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={report}.csv"}
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ======================= PLANNING =======================
+
+@app.route('/api/plan/capacity')
+def api_plan_capacity():
+    """Dry-run: per-slot demand, shortfall and invigilators for the exam series; writes nothing"""
+    date = request.args.get('date')
+    session = request.args.get('session')
+    try:
+        halls, exams = gather(
+            lambda: supabase.table("halls").select("id, capacity, rows, cols, block_id, blocks(name)").order("id").execute().data,
+            get_exams,
+        )
+        slots = group_exam_slots(exams, date, session)
+        
+        return jsonify(plan_capacity(slots, load_registrations(slots), halls))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # ======================= ALLOCATION =======================
 
+def department_of(student):
+    """Seating group for the campus plan: the student's department abbreviation"""
+    return (student.get("departments") or {}).get("abbr", "UNKNOWN")
+
+def seat_plan_rows(result):
+    """allocate_seats rows for the seats placed in an assign_seats result"""
+    return [
+        {
+            "id": student["id"],
+            "hall_id": hall["id"],
+            "seat": seat,
+            "seat_label": f"{group} {student['roll_no'][-2:]}"
+        }
+        for hall, seat, group, student in result["plan"].placements()
+    ]
+
+def log_hall_fill(result, log):
+    """Append one line per hall that received students; returns the number of such halls"""
+    halls_used = 0
+    for summary in result["halls"]:
+        if not summary["filled"]:
+            continue
+        halls_used += 1
+        breakdown = " + ".join(f"{count} {dept}" for dept, count in summary["groups"].items())
+        log.append(f"✅ {summary['hall']['name']}: {breakdown} = {summary['filled']} students")
+    return halls_used
+
+def validate_seating(halls, students, seat_plan):
+    """Validate the seating `students` will have once `seat_plan` rows are written over them"""
+    placed = {row["id"]: row for row in seat_plan}
+    rows = [{**student, **placed.get(student["id"], {})} for student in students]
+    plan = SeatPlan.from_rows(halls, rows, group=department_of)
+    return validate_plan(plan, key=lambda student: student["reg_no"],
+                         expected=[student["reg_no"] for student in students])
+
+def patch_seat_cards(students, halls, seat_plan, roster=None):
+    """Refresh the hall-ticket lookup cache for `students` from the seat rows just written.
+
+    `roster` (every current student) also evicts cards of students no longer in it.
+    """
+    if roster is not None:
+        seat_cards.retain(s["reg_no"] for s in roster)
+    placed = {p["id"]: p for p in seat_plan}
+    halls_by_id = {h["id"]: h for h in halls}
+    seat_cards.update(
+        seat_card({
+            **student,
+            "seat": placed.get(student["id"], {}).get("seat"),
+            "halls": halls_by_id.get(placed.get(student["id"], {}).get("hall_id"))
+        })
+        for student in students
+    )
+
 @app.route('/api/allot', methods=['POST'])
 def api_run_allotment():
     """Run the seat allocation algorithm"""
+    if request.args.get('mode') == 'slots':
+        return run_slot_allotment()
+    if request.args.get('mode') == 'incremental':
+        return run_incremental_allotment()
+    
+    batch_size = request.args.get('batch_size', type=int)
+    invalidate_cache()
     try:
-        # Clear existing allocations
-        clear_all_allocations()
-        
-        # Fetch all data
-        halls_response = supabase.table("halls").select("*").order("id").execute()
-        students_response = supabase.table("students").select("*, departments(abbr)").order("department_id, id").execute()
-        
-        halls = halls_response.data
-        students = students_response.data
+        # Clearing and both reads are independent; every student is reseated below.
+        # The roster is paged past the PostgREST row cap, or students beyond it would lose their seat
+        _, halls, students = gather(
+            clear_all_allocations,
+            lambda: supabase.table("halls").select("*, blocks(key, name)").order("id").execute().data,
+            lambda: fetch_all_rows("students", "*, departments(abbr, color)"),
+        )
+        students.sort(key=lambda s: (s["department_id"], s["id"]))
+        # Clear and halls, plus one roster request per full 1,000-row page and the last short one
+        round_trips = 3 + len(students) // 1000
         
         if not halls:
             return jsonify({"status": "error", "message": "No halls configured"})
@@ -261,100 +532,173 @@ def api_run_allotment():
         # Group students by department
         dept_students = {}
         for s in students:
-            dept = s.get("departments", {}).get("abbr", "UNKNOWN")
-            if dept not in dept_students:
-                dept_students[dept] = []
-            dept_students[dept].append(s)
-        
-        # Zigzag allocation pattern (13/12 split)
-        # Assuming departments: AUTO, CIVIL, CSE, EEE, ECE, MECH, CSEDS, IT
-        allocation_pattern = [
-            {'hall': 'T 1', 'deptA': 'AUTO', 'countA': 13, 'deptB': 'ECE', 'countB': 12},
-            {'hall': 'T 2', 'deptA': 'AUTO', 'countA': 12, 'deptB': 'ECE', 'countB': 13},
-            {'hall': 'T 3', 'deptA': 'AUTO', 'countA': 13, 'deptB': 'ECE', 'countB': 12},
-            {'hall': 'T 6 A', 'deptA': 'AUTO', 'countA': 12, 'deptB': 'ECE', 'countB': 13},
-            {'hall': 'T 6 B', 'deptA': 'CSE', 'countA': 13, 'deptB': 'ECE', 'countB': 12},
-            {'hall': 'EEE1', 'deptA': 'CSE', 'countA': 13, 'deptB': 'EEE', 'countB': 12},
-            {'hall': 'EEE2', 'deptA': 'CSE', 'countA': 12, 'deptB': 'EEE', 'countB': 13},
-            {'hall': 'EEE3', 'deptA': 'CSE', 'countA': 13, 'deptB': 'EEE', 'countB': 12},
-            {'hall': 'CT 10', 'deptA': 'CSE', 'countA': 12, 'deptB': 'EEE', 'countB': 13},
-            {'hall': 'CT 11', 'deptA': 'CIVIL', 'countA': 12, 'deptB': 'IT', 'countB': 13},
-            {'hall': 'CT 12', 'deptA': 'CIVIL', 'countA': 13, 'deptB': 'IT', 'countB': 12},
-            {'hall': 'M - 2', 'deptA': 'CIVIL', 'countA': 12, 'deptB': 'IT', 'countB': 13},
-            {'hall': 'M - 3', 'deptA': 'CIVIL', 'countA': 13, 'deptB': 'IT', 'countB': 12},
-            {'hall': 'M - 6', 'deptA': 'MECH', 'countA': 13, 'deptB': 'CSEDS', 'countB': 12},
-            {'hall': 'AH1', 'deptA': 'MECH', 'countA': 12, 'deptB': 'CSEDS', 'countB': 13},
-            {'hall': 'AH2', 'deptA': 'MECH', 'countA': 13, 'deptB': 'CSEDS', 'countB': 12},
-            {'hall': 'AH3', 'deptA': 'MECH', 'countA': 12, 'deptB': 'CSEDS', 'countB': 13},
-            {'hall': 'A - 1', 'deptA': 'CSE', 'countA': 13, 'deptB': 'ECE', 'countB': 12},
-            {'hall': 'A - 3', 'deptA': 'EEE', 'countA': 12, 'deptB': 'IT', 'countB': 13},
-            {'hall': 'A - 4', 'deptA': 'MECH', 'countA': 13, 'deptB': 'AUTO', 'countB': 12},
+            dept_students.setdefault(department_of(s), []).append(s)
+        
+        # Departments never sit next to each other; extra students are reported, not dropped
+        result = assign_seats(halls, dept_students)
+        
+        # Seat plan is built in memory and flushed in bulk afterwards
+        seat_plan = seat_plan_rows(result)
+        halls_used = log_hall_fill(result, log)
+        
+        unseated = [item["student"]["reg_no"] for item in result["unseated"]]
+        if unseated:
+            log.append(f"⚠️ {len(unseated)} students could not be seated - add halls or capacity")
+        
+        # Clearing ran first, so students not in the plan end up without a seat
+        validation = validate_seating(halls, [{**s, "hall_id": None, "seat": None} for s in students], seat_plan)
+        log.append(describe(validation))
+        
+        round_trips += bulk_allocate_seats(seat_plan, batch_size)
+        invalidate_cache("stats")
+        
+        patch_seat_cards(students, halls, seat_plan, roster=students)
+        total_allocated = len(seat_plan)
+        
+        log.append(f"🎉 Total allocated: {total_allocated} students across {halls_used} halls")
+        log.append(f"📡 Database round trips: {round_trips}")
+        
+        return jsonify({
+            "status": "success",
+            "log": log,
+            "allocated": total_allocated,
+            "unseated": unseated,
+            "roundTrips": round_trips,
+            "validation": validation
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def run_incremental_allotment():
+    """Seat only students without a valid seat; everyone else keeps theirs"""
+    batch_size = request.args.get('batch_size', type=int)
+    invalidate_cache()
+    try:
+        halls, students = gather(
+            lambda: supabase.table("halls").select("*, blocks(key, name)").order("id").execute().data,
+            lambda: fetch_all_rows("students", "*, departments(abbr, color)"),
+        )
+        
+        if not halls:
+            return jsonify({"status": "error", "message": "No halls configured"})
+        
+        # Removed students are simply gone; new ones, and those whose hall vanished
+        # or shrank below their seat, are the only ones that move
+        occupied, kept, to_place = keep_existing_seats(students, halls, department_of)
+        
+        log = []
+        log.append(f"🔒 Keeping {len(kept)} existing seats")
+        log.append(f"🆕 {len(to_place)} students need a seat")
+        
+        dept_students = {}
+        for s in to_place:
+            dept_students.setdefault(department_of(s), []).append(s)
+        
+        result = assign_seats(halls, dept_students, occupied=occupied)
+        seat_plan = seat_plan_rows(result)
+        log_hall_fill(result, log)
+        
+        # Students that lost a seat and found no new one must not keep the stale one
+        seat_plan += [
+            {"id": item["student"]["id"], "hall_id": None, "seat": None, "seat_label": None}
+            for item in result["unseated"]
+            if item["student"].get("hall_id") is not None
         ]
         
-        total_allocated = 0
+        unseated = [item["student"]["reg_no"] for item in result["unseated"]]
+        if unseated:
+            log.append(f"⚠️ {len(unseated)} students could not be seated - add halls or capacity")
         
-        for pattern in allocation_pattern:
-            hall = next((h for h in halls if h['name'] == pattern['hall']), None)
-            if not hall:
-                log.append(f"⚠️ Hall {pattern['hall']} not found, skipping")
-                continue
-            
-            dept_a = pattern['deptA']
-            dept_b = pattern['deptB']
-            
-            students_a = dept_students.get(dept_a, [])[:pattern['countA']]
-            students_b = dept_students.get(dept_b, [])[:pattern['countB']]
-            
-            # Remove allocated students from pool
-            if dept_a in dept_students:
-                dept_students[dept_a] = dept_students[dept_a][pattern['countA']:]
-            if dept_b in dept_students:
-                dept_students[dept_b] = dept_students[dept_b][pattern['countB']:]
-            
-            # Zigzag allocation
-            idx_a, idx_b = 0, 0
-            for col in range(5):
-                for row in range(5):
-                    seat = row * 5 + col
-                    use_a = (row + col) % 2 == 0
-                    
-                    if use_a and idx_a < len(students_a):
-                        student = students_a[idx_a]
-                        idx_a += 1
-                    elif not use_a and idx_b < len(students_b):
-                        student = students_b[idx_b]
-                        idx_b += 1
-                    elif idx_a < len(students_a):
-                        student = students_a[idx_a]
-                        idx_a += 1
-                    elif idx_b < len(students_b):
-                        student = students_b[idx_b]
-                        idx_b += 1
-                    else:
-                        continue
-                    
-                    # Update student allocation in database
-                    # In Supabase, the student departments are in a related table, but the query fetched them
-                    # seat_label = f"{student.get('departments', {}).get('abbr', 'UNK')} {student['roll_no'][-2:]}"
-                    # Just use the dept abbr we already have
-                    dept_label = student.get('departments', {}).get('abbr', 'UNK')
-                    seat_label = f"{dept_label} {student['roll_no'][-2:]}"
-                    
-                    supabase.table("students").update({
-                        "hall_id": hall["id"],
-                        "seat": seat,
-                        "seat_label": seat_label
-                    }).eq("id", student["id"]).execute()
-                    total_allocated += 1
-            
-            log.append(f"✅ {pattern['hall']}: {idx_a} {dept_a} + {idx_b} {dept_b} = {idx_a + idx_b} students")
-        
-        log.append(f"🎉 Total allocated: {total_allocated} students across {len(allocation_pattern)} halls")
-        
-        return jsonify({"status": "success", "log": log, "allocated": total_allocated})
+        validation = validate_seating(halls, students, seat_plan)
+        log.append(describe(validation))
+        
+        if seat_plan:
+            bulk_allocate_seats(seat_plan, batch_size)
+            invalidate_cache("stats")
+        patch_seat_cards(to_place, halls, seat_plan, roster=students)
+        
+        log.append(f"🎉 Rows changed: {len(seat_plan)}")
+        
+        return jsonify({
+            "status": "success",
+            "log": log,
+            "allocated": len(kept) + len(result["plan"]),
+            "changed": len(seat_plan),
+            "unseated": unseated,
+            "validation": validation
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def run_slot_allotment():
+    """Seat every exam slot into the allotments table, optionally planning slots in parallel"""
+    workers = request.args.get('workers', 1, type=int)
+    seed = request.args.get('seed', type=int)
+    date = request.args.get('date')
+    session = request.args.get('session')
+    invalidate_cache()
+    try:
+        halls, exams = gather(
+            lambda: supabase.table("halls").select("id, capacity, rows, cols").order("id").execute().data,
+            get_exams,
+        )
+        if not halls:
+            return jsonify({"status": "error", "message": "No halls configured"})
+        
+        slots = group_exam_slots(exams, date, session)
+        if not slots:
+            return jsonify({"status": "error", "message": "No exams found"})
+        
+        plans = plan_slots(slots, load_registrations(slots), halls, workers=workers, seed=seed)
+        
+        log = []
+        exam_ids = []
+        rows = []
+        for plan in plans:
+            log.extend(plan["log"])
+            exam_ids.extend(plan["exam_ids"])
+            rows.extend(plan["rows"])
+        
+        # A plan that seats someone twice or overfills a hall is never written
+        validation = summarize(plan["validation"] for plan in plans)
+        outcome = status(validation)
+        report = {
+            "status": outcome,
+            "log": log,
+            "slots": len(plans),
+            "validation": validation,
+            "clashes": sum(len(plan["clashes"]) for plan in plans)
+        }
+        if outcome == "error":
+            return jsonify({**report, "message": f"Plan not written. {describe(validation)}", "allocated": 0})
+        
+        replace_allotments(exam_ids, rows)
+        invalidate_cache("stats")
+        log.append(f"🎉 Total allotted: {len(rows)} seats across {len(plans)} slots ({workers} workers)")
+        
+        if outcome == "partial":
+            report["message"] = f"Plan written with problems. {describe(validation)}"
+        return jsonify({**report, "allocated": len(rows)})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# ======================= CLI =======================
+
+@app.cli.command("backfill-subjects")
+@click.option("--database-url", envvar="SQLALCHEMY_DATABASE_URI", default="sqlite:///exam_hall.db",
+              show_default=True, help="SQLAlchemy URL of the ORM database (relative SQLite paths are under instance/)")
+@click.option("--batch-size", default=1000, show_default=True)
+def backfill_subjects_command(database_url, batch_size):
+    """Copy students.subjects_registered into student_subjects on the ORM database"""
+    from models import StudentSubject, backfill_student_subjects, db
+    
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    db.init_app(app)
+    with app.app_context():
+        # Databases created before student_subjects existed lack the table
+        StudentSubject.__table__.create(db.engine, checkfirst=True)
+        click.echo(f"✅ Backfilled {backfill_student_subjects(batch_size)} subject registrations")
+
 # ======================= MAIN =======================
 
 if __name__ == '__main__':
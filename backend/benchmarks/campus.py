@@ -0,0 +1,121 @@
+"""
+Synthetic campus generator for the allotment benchmarks.
+
+A campus has departments split into year-wise classes, blocks of halls with
+varied capacity and grid shape, and a timetable of exam slots. Subject
+registrations overlap the way the real roll does: every class shares a set
+of common papers, sits its own core papers and picks a few electives from a
+pool shared across departments.
+"""
+
+import datetime
+import random
+from typing import Any, Dict, List
+
+from models import Block, Department, Exam, Hall, Student, db
+
+SIZES = {
+    "small": {"departments": 4, "halls": 12, "slots": 4, "students": 60},
+    "medium": {"departments": 8, "halls": 40, "slots": 10, "students": 250},
+    "large": {"departments": 16, "halls": 120, "slots": 20, "students": 600},
+}
+
+HALL_GRIDS = [(5, 5), (6, 5), (8, 6), (10, 6), (12, 8)]  # (rows, cols)
+HALLS_PER_BLOCK = 8
+YEARS = ["22", "23", "24", "25"]
+COMMON_SUBJECTS = 2
+CORE_SUBJECTS = 3
+ELECTIVES = 2
+
+
+def generate_campus(departments: int, halls: int, slots: int, students: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Build a campus as plain dicts. `students` is the head count per department,
+    spread over the four years.
+    """
+    rng = random.Random(seed)
+
+    depts = [
+        {"id": i + 1, "code": f"{101 + i:03d}", "name": f"Department {i + 1}", "abbr": f"D{i + 1:02d}", "color": "cyan"}
+        for i in range(departments)
+    ]
+
+    blocks = []
+    hall_rows = []
+    for i in range(halls):
+        if i % HALLS_PER_BLOCK == 0:
+            key = f"B{len(blocks) + 1}"
+            blocks.append({"id": len(blocks) + 1, "key": key, "name": f"{key} Block"})
+        rows, cols = rng.choice(HALL_GRIDS)
+        hall_rows.append({
+            "id": i + 1,
+            "name": f"{blocks[-1]['key']} {i % HALLS_PER_BLOCK + 1}",
+            "block_id": blocks[-1]["id"],
+            "capacity": rows * cols - rng.randrange(cols),
+            "rows": rows,
+            "cols": cols,
+            "blocks": {"key": blocks[-1]["key"], "name": blocks[-1]["name"]},
+        })
+
+    # Papers per year, one list per exam round: common to the whole year, core per
+    # department, then one elective from each pool shared across departments
+    pool = max(2, departments // 2)
+    rounds: Dict[str, List[List[str]]] = {}
+    for year in YEARS:
+        rounds[year] = [[f"GE{year}{n}"] for n in range(COMMON_SUBJECTS)]
+        rounds[year] += [[f"{d['abbr']}{year}{n}" for d in depts] for n in range(CORE_SUBJECTS)]
+        rounds[year] += [[f"OE{year}{n}{k:02d}" for k in range(pool)] for n in range(ELECTIVES)]
+
+    student_rows = []
+    per_year = max(1, students // len(YEARS))
+    for dept in depts:
+        for year in YEARS:
+            common = [codes[0] for codes in rounds[year][:COMMON_SUBJECTS]]
+            core = [f"{dept['abbr']}{year}{n}" for n in range(CORE_SUBJECTS)]
+            for n in range(1, per_year + 1):
+                electives = [rng.choice(codes) for codes in rounds[year][COMMON_SUBJECTS + CORE_SUBJECTS:]]
+                student_rows.append({
+                    "id": len(student_rows) + 1,
+                    "reg_no": f"7311{year}{dept['code']}{n:03d}",
+                    "roll_no": f"{year}{dept['abbr']}{n:02d}",
+                    "name": f"{dept['abbr']} Student {n}",
+                    "department_id": dept["id"],
+                    "year_joined": year,
+                    "year_of_study": 26 - int(year),
+                    "student_type": "Regular",
+                    "subjects": sorted(common + core + electives),
+                    "departments": {"abbr": dept["abbr"], "color": dept["color"]},
+                })
+
+    # Each round is one slot; a year's rounds only collide when there are fewer slots than rounds
+    start = datetime.date(2025, 11, 10)
+    slot_keys = [(start + datetime.timedelta(days=i // 2), "FN" if i % 2 == 0 else "AN") for i in range(slots)]
+    exams = []
+    for y, year in enumerate(YEARS):
+        for r, codes in enumerate(rounds[year]):
+            date, session = slot_keys[(y * len(rounds[year]) + r) % slots]
+            for code in codes:
+                exams.append({"id": len(exams) + 1, "date": date, "session": session,
+                              "subject_code": code, "subject_name": code})
+
+    return {"departments": depts, "blocks": blocks, "halls": hall_rows, "students": student_rows, "exams": exams}
+
+
+def load_campus(campus: Dict[str, Any]):
+    """Write a generated campus into the SQLAlchemy models (tables must already exist)"""
+    db.session.bulk_insert_mappings(Department, campus["departments"])
+    db.session.bulk_insert_mappings(Block, [
+        {"id": b["id"], "key": b["key"], "name": b["name"]} for b in campus["blocks"]
+    ])
+    db.session.bulk_insert_mappings(Hall, [
+        {"id": h["id"], "name": h["name"], "block_id": h["block_id"], "capacity": h["capacity"],
+         "rows": h["rows"], "cols": h["cols"]}
+        for h in campus["halls"]
+    ])
+    # Registrations go through set_subjects, the ORM's dual-write to both subject columns
+    for s in campus["students"]:
+        student = Student(**{k: v for k, v in s.items() if k not in ("subjects", "departments")})
+        student.set_subjects(s["subjects"])
+        db.session.add(student)
+    db.session.bulk_insert_mappings(Exam, campus["exams"])
+    db.session.commit()
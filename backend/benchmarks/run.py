@@ -0,0 +1,203 @@
+"""
+Allotment benchmarks: generate a synthetic campus, run the allocators against
+it and write wall time, SQL statement counts and peak memory as JSON.
+
+    cd backend
+    python -m benchmarks.run --size medium --output bench.json
+    python -m benchmarks.run --database-url postgresql://localhost/bench --reset
+
+Campus seating (the core of POST /api/allot), its validation and the capacity plan are run
+on in-memory rows; the Supabase round trips around them are not measured. The ORM
+listing serializers must stay within SERIALIZERS' statement limits or the run fails.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from flask import Flask
+
+from benchmarks.campus import SIZES, generate_campus, load_campus
+from models import (
+    Student,
+    assert_max_queries,
+    count_queries,
+    db,
+    serialize_blocks,
+    serialize_halls,
+    serialize_students,
+)
+from services.logic import group_exam_slots, run_allotment
+from services.planning import plan_capacity
+from services.registrations import RegistrationMatrix
+from services.seating import assign_seats
+from services.validator import validate_plan
+
+
+# Statements each listing serializer may run whatever the row count; going past one fails the run
+SERIALIZERS = {
+    "halls": (serialize_halls, 2),
+    "blocks": (serialize_blocks, 2),
+    "students": (serialize_students, 1),
+}
+
+
+def measure(func, repeat):
+    """Time `func` `repeat` times, then once more under tracemalloc for peak memory"""
+    timings = []
+    with count_queries() as counter:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, {
+        "runs": repeat,
+        "seconds": {
+            "min": round(min(timings), 6),
+            "median": round(statistics.median(timings), 6),
+            "max": round(max(timings), 6),
+        },
+        "queries": counter.count // repeat,
+        "peakMemoryBytes": peak,
+    }
+
+
+def campus_seating(campus):
+    """assign_seats by department over every hall, as api_run_allotment does"""
+    groups = {}
+    for student in campus["students"]:
+        groups.setdefault(student["departments"]["abbr"], []).append(student)
+    return assign_seats(campus["halls"], groups)
+
+
+def capacity_plan(campus):
+    slots = group_exam_slots(campus["exams"])
+    registrations = RegistrationMatrix((code, s["id"]) for s in campus["students"] for code in s["subjects"])
+    return plan_capacity(slots, registrations, campus["halls"])
+
+
+def seat_students(plan):
+    """Store a campus seating on the students table, so hall listings carry seated students"""
+    db.session.bulk_update_mappings(Student, [
+        {"id": student["id"], "hall_id": hall["id"], "seat": seat} for hall, seat, _, student in plan.placements()
+    ])
+    db.session.commit()
+
+
+def serialization():
+    """Serialize every listing under its statement limit; raises AssertionError past it"""
+    rows = {}
+    for name, (serialize, limit) in SERIALIZERS.items():
+        with assert_max_queries(limit):
+            rows[name] = len(serialize())
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--departments", type=int)
+    parser.add_argument("--halls", type=int)
+    parser.add_argument("--slots", type=int)
+    parser.add_argument("--students", type=int, help="students per department")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1, help="process pool size for run_allotment")
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--reset", action="store_true", help="allow dropping all tables on a non-SQLite database")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+
+    if not args.database_url.startswith("sqlite") and not args.reset:
+        parser.error("--reset is required to drop and recreate tables on a non-SQLite database")
+
+    shape = dict(SIZES[args.size])
+    for key in shape:
+        if getattr(args, key) is not None:
+            shape[key] = getattr(args, key)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = args.database_url
+    db.init_app(app)
+
+    campus = generate_campus(seed=args.seed, **shape)
+    results = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        load_campus(campus)
+        load_seconds = time.perf_counter() - started
+
+        outcome, results["run_allotment"] = measure(
+            lambda: run_allotment(workers=args.workers, seed=args.seed), args.repeat
+        )
+        results["run_allotment"]["allocated"] = outcome["allocated"]
+
+        outcome, results["campus_seating"] = measure(lambda: campus_seating(campus), args.repeat)
+        results["campus_seating"]["allocated"] = len(outcome["plan"])
+        results["campus_seating"]["unseated"] = len(outcome["unseated"])
+
+        plan = outcome["plan"]
+        outcome, results["plan_validation"] = measure(lambda: validate_plan(plan, key=lambda s: s["id"]), args.repeat)
+        results["plan_validation"]["adjacent"] = outcome["adjacent"]
+
+        outcome, results["capacity_plan"] = measure(lambda: capacity_plan(campus), args.repeat)
+        results["capacity_plan"]["totalShortfall"] = outcome["totalShortfall"]
+
+        seat_students(plan)
+        outcome, results["serialization"] = measure(serialization, args.repeat)
+        results["serialization"]["rows"] = outcome
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "database": args.database_url.split(":", 1)[0],
+        "campus": {
+            "departments": shape["departments"],
+            "halls": shape["halls"],
+            "slots": shape["slots"],
+            "studentsPerDepartment": shape["students"],
+            "seed": args.seed,
+            "students": len(campus["students"]),
+            "capacity": sum(h["capacity"] for h in campus["halls"]),
+            "exams": len(campus["exams"]),
+            "loadSeconds": round(load_seconds, 4),
+        },
+        "workers": args.workers,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        print(f"{name:16} {result['seconds']['median']:.4f}s  {result['queries']:4} queries  "
+              f"{result['peakMemoryBytes'] / 1024:.0f} KiB")
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
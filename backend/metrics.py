@@ -0,0 +1,254 @@
+"""
+Request and database instrumentation for the Flask backend.
+
+Records per-route latency and payload sizes, and every Supabase (HTTP) and
+SQLAlchemy call with its duration, both process-wide and per request.
+Everything is kept in memory and rendered in the Prometheus text format
+for /api/metrics.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+import httpx
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CALL_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Calls made while a request is being served are also tallied against it
+_request_calls = contextvars.ContextVar("request_calls", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus expects"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, values, amount):
+        counts, total = self.series.get(values) or ([0] * (len(self.buckets) + 1), 0)
+        counts[bisect_left(self.buckets, amount)] += 1
+        self.series[values] = (counts, total + amount)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in sorted(self.series.items()):
+            labels = _labels(self.labels, values)
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {running}')
+            running += counts[-1]
+            lines.append(f'{self.name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {running}')
+            lines.append(f"{self.name}_sum{{{labels}}} {round(total, 6)}")
+            lines.append(f"{self.name}_count{{{labels}}} {running}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values, count in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, values)}}} {count}")
+        return lines
+
+
+def _labels(names, values):
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+_lock = threading.Lock()
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to produce a response (streamed: up to its last byte)",
+                            ("method", "route", "status"), LATENCY_BUCKETS)
+REQUEST_BYTES = Histogram("http_request_size_bytes", "Request body size", ("route",), SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram("http_response_size_bytes", "Response body size (streamed bodies excluded)",
+                           ("route",), SIZE_BUCKETS)
+DB_CALLS = Counter("db_calls_total", "Database calls", ("backend", "operation"))
+DB_SECONDS = Histogram("db_call_duration_seconds", "Duration of one database call",
+                       ("backend", "operation"), LATENCY_BUCKETS)
+DB_BYTES = Counter("db_response_bytes_total", "Bytes received from the database API", ("backend", "operation"))
+REQUEST_DB_CALLS = Histogram("http_request_db_calls", "Database calls made while serving one request",
+                             ("route",), CALL_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Database time spent serving one request",
+                               ("route",), LATENCY_BUCKETS)
+
+ALL_METRICS = (REQUEST_SECONDS, REQUEST_BYTES, RESPONSE_BYTES, DB_CALLS, DB_SECONDS, DB_BYTES,
+               REQUEST_DB_CALLS, REQUEST_DB_SECONDS)
+
+
+def record_db_call(backend, operation, seconds, size=0):
+    """Count one database call process-wide and against the current request, if any"""
+    with _lock:
+        DB_CALLS.inc((backend, operation))
+        DB_SECONDS.observe((backend, operation), seconds)
+        if size:
+            DB_BYTES.inc((backend, operation), size)
+        # gather() runs calls for one request on several threads
+        tally = _request_calls.get()
+        if tally is not None:
+            tally[0] += 1
+            tally[1] += seconds
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        lines = [line for metric in ALL_METRICS for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+# ======================= SUPABASE (HTTP) =======================
+
+def _operation(req):
+    """'GET halls' / 'POST rpc/allocate_seats' from a PostgREST request URL"""
+    path = req.url.path
+    target = path.split("/rest/v1/", 1)[-1] if "/rest/v1/" in path else path.strip("/")
+    return f"{req.method} {target}"
+
+
+class _TimedStream(httpx.SyncByteStream):
+    """Response body wrapper that reports the call once the body has been read"""
+
+    def __init__(self, stream, started, operation):
+        self._stream = stream
+        self._started = started
+        self._operation = operation
+        self._size = 0
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._size += len(chunk)
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+        if self._started is not None:
+            record_db_call("supabase", self._operation, time.perf_counter() - self._started, self._size)
+            self._started = None
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """httpx transport that times each Supabase REST call up to the end of its body"""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, req):
+        started = time.perf_counter()
+        try:
+            response = self._transport.handle_request(req)
+        except Exception:
+            record_db_call("supabase", _operation(req), time.perf_counter() - started)
+            raise
+        response.stream = _TimedStream(response.stream, started, _operation(req))
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+# ======================= SQLALCHEMY =======================
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _statement_operation(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement and statement.strip() else "UNKNOWN"
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    record_db_call("sqlalchemy", _statement_operation(statement), time.perf_counter() - started)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    """A failed statement never reaches after_cursor_execute; pop its start time here"""
+    conn = context.connection
+    started = conn.info.get("query_started") if conn is not None else None
+    if started:
+        record_db_call("sqlalchemy", _statement_operation(context.statement), time.perf_counter() - started.pop())
+
+
+# ======================= FLASK =======================
+
+def _tallied(body, tally):
+    """Iterate a streamed body with its database calls tallied against the request"""
+    token = _request_calls.set(tally)
+    try:
+        yield from body
+    finally:
+        _request_calls.reset(token)
+
+
+def init_metrics(app):
+    """Time every request and attach its database call tally"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_calls = [0, 0.0]
+        g.metrics_token = _request_calls.set(g.metrics_calls)
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        method = request.method
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request_size = request.content_length or 0
+        tally = g.metrics_calls
+
+        def observe(size=None):
+            with _lock:
+                calls, db_seconds = tally
+                REQUEST_SECONDS.observe((method, route, response.status_code), time.perf_counter() - started)
+                REQUEST_BYTES.observe((route,), request_size)
+                if size is not None:
+                    RESPONSE_BYTES.observe((route,), size)
+                REQUEST_DB_CALLS.observe((route,), calls)
+                REQUEST_DB_SECONDS.observe((route,), db_seconds)
+
+        if response.is_streamed:
+            # The body (and its database calls) is produced after this hook and after
+            # teardown, so tally it explicitly and observe once it has been sent
+            response.response = _tallied(response.response, tally)
+            response.call_on_close(observe)
+        else:
+            observe(response.calculate_content_length())
+        return response
+
+    @app.teardown_request
+    def _stop_tally(exc):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            _request_calls.reset(token)
+
+    return app
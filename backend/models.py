@@ -3,9 +3,14 @@ GCE Erode Exam Seating System - Database Models
 8 Departments × 4 Years × 66 Students = 2,112 Total
 """
 
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime
 
+from services.seat_plan import DEFAULT_COLUMNS, hall_shape, seat_position
+
 db = SQLAlchemy()
 
 # ======================= MODELS =======================
@@ -60,9 +65,16 @@ class Hall(db.Model):
     name = db.Column(db.String(20), unique=True, nullable=False)  # T 1, CT 10, etc.
     block_id = db.Column(db.Integer, db.ForeignKey('blocks.id'), nullable=False)
     capacity = db.Column(db.Integer, default=25)
+    rows = db.Column(db.Integer, nullable=True)  # derived from capacity when not set
+    cols = db.Column(db.Integer, default=DEFAULT_COLUMNS)
     
     seats = db.relationship('Student', backref='hall_ref', lazy=True)
     
+    @property
+    def shape(self):
+        """(rows, cols) of the seat grid"""
+        return hall_shape({'capacity': self.capacity, 'rows': self.rows, 'cols': self.cols})
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -70,6 +82,8 @@ class Hall(db.Model):
             'block': self.block_ref.name if self.block_ref else None,
             'blockKey': self.block_ref.key if self.block_ref else None,
             'capacity': self.capacity,
+            'rows': self.shape[0],
+            'cols': self.shape[1],
             'filled': len([s for s in self.seats if s.seat is not None]),
             'departments': list(set([s.dept.abbr for s in self.seats if s.seat is not None]))
         }
@@ -90,12 +104,19 @@ class Student(db.Model):
     subjects_registered = db.Column(db.Text, nullable=True)  # Comma-separated subject codes
     
     hall_id = db.Column(db.Integer, db.ForeignKey('halls.id'), nullable=True)
-    seat = db.Column(db.Integer, nullable=True)  # 0-24 for 5x5 grid
+    seat = db.Column(db.Integer, nullable=True)  # row-major index into the hall's rows x cols grid
     seat_label = db.Column(db.String(20), nullable=True)  # ECE 01
     
+    subjects = db.relationship('StudentSubject', backref='student', lazy=True, cascade='all, delete-orphan')
+    
+    def set_subjects(self, codes):
+        """Dual-write registrations to subjects_registered and student_subjects"""
+        codes = sorted({c.strip() for c in codes if c and c.strip()})
+        self.subjects_registered = ','.join(codes) or None
+        self.subjects = [StudentSubject(subject_code=c) for c in codes]
+    
     def to_dict(self):
-        row = (self.seat // 5) + 1 if self.seat is not None else None
-        col = (self.seat % 5) + 1 if self.seat is not None else None
+        row, col = seat_position(self.seat, self.hall_ref.cols if self.hall_ref else None)
         
         return {
             'id': self.id,
@@ -119,6 +140,16 @@ class Student(db.Model):
         }
 
 
+class StudentSubject(db.Model):
+    __tablename__ = 'student_subjects'
+    
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id', ondelete='CASCADE'), primary_key=True)
+    subject_code = db.Column(db.String(20), primary_key=True)
+    
+    # "Who sits exam X" is a range scan on this index
+    __table_args__ = (db.Index('idx_student_subjects_subject', 'subject_code', 'student_id'),)
+
+
 class Exam(db.Model):
     __tablename__ = 'exams'
 
@@ -155,6 +186,79 @@ class Allotment(db.Model):
     __table_args__ = (db.UniqueConstraint('student_id', 'exam_id', name='_student_exam_uc'),)
 
 
+# ======================= SERIALIZATION =======================
+# Listing endpoints load relationships up front, so serializing N rows costs a
+# fixed number of statements instead of one lazy load per row per relationship.
+
+def hall_listing_query():
+    """Halls with their block, seated students and the students' departments eager-loaded"""
+    return Hall.query.options(
+        joinedload(Hall.block_ref),
+        selectinload(Hall.seats).joinedload(Student.dept),
+    ).order_by(Hall.id)
+
+
+def student_listing_query():
+    """Students with department, hall and the hall's block eager-loaded"""
+    return Student.query.options(
+        joinedload(Student.dept),
+        joinedload(Student.hall_ref).joinedload(Hall.block_ref),
+    ).order_by(Student.department_id, Student.id)
+
+
+def serialize_halls(block_key=None):
+    """All halls (optionally one block) as dicts in a bounded number of queries"""
+    query = hall_listing_query()
+    if block_key:
+        query = query.join(Hall.block_ref).filter(Block.key == block_key)
+    return [h.to_dict() for h in query.all()]
+
+
+def serialize_blocks():
+    """All blocks with their hall names in two queries"""
+    return [b.to_dict() for b in Block.query.options(selectinload(Block.halls)).order_by(Block.id).all()]
+
+
+def serialize_students(department_id=None):
+    """Students (optionally one department) as dicts in a single joined query"""
+    query = student_listing_query()
+    if department_id:
+        query = query.filter(Student.department_id == department_id)
+    return [s.to_dict() for s in query.all()]
+
+
+class QueryCounter:
+    """Counts SQL statements executed on the engine while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """with count_queries() as counter: ... then read counter.count"""
+    counter = QueryCounter()
+    event.listen(db.engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_max_queries(limit):
+    """Fail when the wrapped block runs more than `limit` SQL statements"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(f"Expected at most {limit} queries, ran {counter.count}:\n" + "\n".join(counter.statements))
+
+
 # ======================= SEED DATA =======================
 
 DEPARTMENTS = [
@@ -214,7 +318,8 @@ def seed_database():
             hall = Hall(name=hall_name, block_id=block.id, capacity=25)
             db.session.add(hall)
     
-    # Seed students: 8 depts × 4 years × 66 = 2,112
+    # Seed students: 8 depts × 4 years × 66 = 2,112, written in one bulk insert
+    students = []
     for year in YEARS:
         for dept_data in DEPARTMENTS:
             dept = dept_map[dept_data['code']]
@@ -228,72 +333,32 @@ def seed_database():
                 reg_no = f"7311{year}{dept_data['code']}{str(i).padStart(3, '0')}" if hasattr(str, 'padStart') else f"7311{year}{dept_data['code']}{str(i).zfill(3)}"
                 roll_no = f"{year}{dept_data['abbr']}{str(i).zfill(2)}"
                 
-                student = Student(
-                    reg_no=reg_no,
-                    roll_no=roll_no,
-                    name=f"{dept_data['abbr']} Student {i}",
-                    department_id=dept.id,
-                    year_joined=year,
-                    year_of_study=26 - int(year),  # 2026 - year
-                    student_type='Regular'
-                )
-                db.session.add(student)
+                students.append({
+                    'reg_no': reg_no,
+                    'roll_no': roll_no,
+                    'name': f"{dept_data['abbr']} Student {i}",
+                    'department_id': dept.id,
+                    'year_joined': year,
+                    'year_of_study': 26 - int(year),  # 2026 - year
+                    'student_type': 'Regular'
+                })
     
+    db.session.bulk_insert_mappings(Student, students)
     db.session.commit()
     print(f"✅ Seeded {Student.query.count()} students across {Department.query.count()} departments")
-=======
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Time, UniqueConstraint
-from sqlalchemy.orm import relationship
-from database import Base
-
-class Student(Base):
-    __tablename__ = "students"
-
-    id = Column(Integer, primary_key=True, index=True)
-    reg_no = Column(String, unique=True, index=True)
-    name = Column(String)
-    department = Column(String)
-    year = Column(String) # e.g., "1st Year", "3rd Sem"
-    subjects_registered = Column(String) # Comma-separated subject codes e.g. "CS3151,MA3151"
-    
-    # Relationships
-    allotments = relationship("Allotment", back_populates="student")
 
-class Exam(Base):
-    __tablename__ = "exams"
 
-    id = Column(Integer, primary_key=True, index=True)
-    date = Column(Date)
-    session = Column(String) # FN (Forenoon) or AN (Afternoon)
-    subject_code = Column(String, index=True)
-    subject_name = Column(String)
+def backfill_student_subjects(batch_size=1000):
+    """Copy comma-separated subjects_registered into student_subjects for rows not yet migrated"""
+    migrated = {sid for (sid,) in db.session.query(StudentSubject.student_id).distinct()}
+    rows = []
+    query = db.session.query(Student.id, Student.subjects_registered).filter(Student.subjects_registered.isnot(None))
+    for student_id, subjects_registered in query.yield_per(batch_size):
+        if student_id in migrated:
+            continue
+        for code in sorted({c.strip() for c in subjects_registered.split(',') if c.strip()}):
+            rows.append({'student_id': student_id, 'subject_code': code})
     
-    # Relationships
-    allotments = relationship("Allotment", back_populates="exam")
-
-class Hall(Base):
-    __tablename__ = "halls"
-
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True) # e.g., "Hall A", "Room 301"
-    capacity = Column(Integer)
-    
-    # Relationships
-    allotments = relationship("Allotment", back_populates="hall")
-
-class Allotment(Base):
-    __tablename__ = "allotments"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("students.id"))
-    exam_id = Column(Integer, ForeignKey("exams.id"))
-    hall_id = Column(Integer, ForeignKey("halls.id"))
-    seat_number = Column(Integer) # Relative seat number in the hall
-    
-    student = relationship("Student", back_populates="allotments")
-    exam = relationship("Exam", back_populates="allotments")
-    hall = relationship("Hall", back_populates="allotments")
-    
-    # Ensure a student is not allotted twice for the same exam
-    __table_args__ = (UniqueConstraint('student_id', 'exam_id', name='_student_exam_uc'),)
->>>>>>> 2d8beaa9fd737bb6d330f13204e5079f2524bfcb
+    db.session.bulk_insert_mappings(StudentSubject, rows)
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,91 @@
+"""
+Streaming CSV reports for the seating plan: per-hall seating charts,
+consolidated hall lists and attendance sheets.
+Every report consumes rows already ordered by (slot, hall, seat) and
+yields CSV lines, so only one hall is ever held in memory.
+"""
+
+import csv
+from typing import Any, Dict, Iterable, Iterator, List
+
+from services.seat_plan import seat_position
+
+REPORTS = ("seating", "halls", "attendance")
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line straight back"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def seat_rows(rows: Iterable[Dict[str, Any]], halls: Dict[int, Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Normalise raw seat rows into flat records.
+    Each input row carries hall_id, seat (0-based), date, session, subject_code
+    and the embedded student/department fields.
+    """
+    for row in rows:
+        hall = halls.get(row["hall_id"]) or {}
+        block = hall.get("blocks") or {}
+        seat = row["seat"]
+        seat_row, seat_col = seat_position(seat, hall.get("cols"))
+        dept = row.get("departments") or {}
+        yield {
+            "date": row.get("date") or "",
+            "session": row.get("session") or "",
+            "block": block.get("name") or "",
+            "hall": hall.get("name") or "",
+            "seat": seat + 1,
+            "seatCode": f"R{seat_row}C{seat_col}",
+            "regNo": row["reg_no"],
+            "rollNo": row["roll_no"],
+            "name": row["name"],
+            "department": dept.get("abbr") or "",
+            "subject": row.get("subject_code") or "",
+        }
+
+
+def _seating(records: Iterable[Dict[str, Any]]) -> Iterator[List[Any]]:
+    yield ["Date", "Session", "Block", "Hall", "Seat", "Seat Code", "Reg No", "Roll No", "Name", "Department", "Subject"]
+    for r in records:
+        yield [r["date"], r["session"], r["block"], r["hall"], r["seat"], r["seatCode"],
+               r["regNo"], r["rollNo"], r["name"], r["department"], r["subject"]]
+
+
+def _attendance(records: Iterable[Dict[str, Any]]) -> Iterator[List[Any]]:
+    yield ["Date", "Session", "Hall", "Seat", "Reg No", "Name", "Department", "Subject", "Answer Booklet No", "Signature"]
+    for r in records:
+        yield [r["date"], r["session"], r["hall"], r["seat"], r["regNo"], r["name"],
+               r["department"], r["subject"], "", ""]
+
+
+def _hall_lists(records: Iterable[Dict[str, Any]]) -> Iterator[List[Any]]:
+    """One line per (slot, hall, department) with head count and register number range"""
+    yield ["Date", "Session", "Block", "Hall", "Department", "Students", "From Reg No", "To Reg No"]
+
+    current = None
+    groups: Dict[str, List[str]] = {}
+    for r in records:
+        key = (r["date"], r["session"], r["block"], r["hall"])
+        if key != current:
+            if current:
+                yield from _hall_summary(current, groups)
+            current, groups = key, {}
+        groups.setdefault(r["department"], []).append(r["regNo"])
+    if current:
+        yield from _hall_summary(current, groups)
+
+
+def _hall_summary(key, groups: Dict[str, List[str]]) -> Iterator[List[Any]]:
+    for dept, reg_nos in groups.items():
+        yield [*key, dept, len(reg_nos), min(reg_nos), max(reg_nos)]
+
+
+def stream_csv(report: str, records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """Yield the named report as CSV text, one line at a time"""
+    builders = {"seating": _seating, "halls": _hall_lists, "attendance": _attendance}
+    writer = csv.writer(_Echo())
+    for line in builders[report](records):
+        yield writer.writerow(line)
@@ -0,0 +1,190 @@
+"""
+Bulk student import: turns the roster CSV layout or parsed nominal-roll rows
+into validated `students` records and loads them in chunks.
+"""
+
+import csv
+import re
+import time
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Cap on per-row entries in an import report's "errors"; "rejected" has the full count
+MAX_REPORTED_ERRORS = 100
+
+REG_NO_PATTERN = re.compile(r"^\d{10,15}$")
+
+# Columns a nominal-roll PDF actually provides; existing students keep every other value
+PDF_COLUMNS = ("name", "subjects_registered")
+
+
+def rows_from_csv(stream) -> Iterator[Dict[str, Any]]:
+    """Read rows in the roster CSV layout (Reg_No, Roll_No, ..., Subjects_Registered)."""
+    for row in csv.DictReader(stream):
+        yield {
+            "reg_no": (row.get("Reg_No") or "").strip(),
+            "roll_no": (row.get("Roll_No") or "").strip(),
+            "name": (row.get("Name") or "").strip(),
+            "department": (row.get("Department") or "").strip(),
+            "year_joined": (row.get("Year_Joined") or "").strip(),
+            "year_of_study": (row.get("Year_of_Study") or "").strip(),
+            "student_type": (row.get("Student_Type") or "").strip() or "Regular",
+            "subjects": (row.get("Subjects_Registered") or "").split(","),
+        }
+
+
+def rows_from_parsed(students: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Adapt PDFParser.parse_student_list output; year and department come from the reg no.
+    Roll number, type and year are guesses for new students only: import these rows
+    with `columns=PDF_COLUMNS` so existing students keep their real values. A name
+    the parser could not read stays None, and the stored name is kept.
+    """
+    for student in students:
+        reg_no = student["reg_no"]
+        yield {
+            "reg_no": reg_no,
+            "roll_no": "",
+            "name": student.get("name"),
+            "department_code": reg_no[6:9],
+            "year_joined": reg_no[4:6],
+            "year_of_study": "",
+            "student_type": "Regular",
+            "subjects": student.get("registered_subjects") or [],
+        }
+
+
+def year_of_study(year_joined: str, today: Optional[date] = None) -> int:
+    """Academic year of study for a two-digit joining year; the year turns over in June."""
+    today = today or date.today()
+    years = (today.year % 100) - int(year_joined) + (1 if today.month >= 6 else 0)
+    return min(max(years, 1), 4)
+
+
+def validate_row(row: Dict[str, Any], departments: Dict[str, Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Turn an input row into a students record.
+    `departments` maps both department abbr and code to the department row.
+    A name of None (unreadable, as opposed to blank) passes through for the
+    writer to fill from the stored student.
+    Returns (record, None) or (None, error message).
+    """
+    reg_no = row["reg_no"]
+    if not REG_NO_PATTERN.match(reg_no):
+        return None, "invalid register number"
+    if row["name"] is not None and not row["name"]:
+        return None, "missing name"
+
+    dept = departments.get(row.get("department") or row.get("department_code") or "")
+    if not dept:
+        return None, "unknown department"
+
+    year_joined = row["year_joined"][-2:]
+    if not year_joined.isdigit():
+        return None, "invalid joining year"
+
+    if row["year_of_study"]:
+        if not row["year_of_study"].isdigit():
+            return None, "invalid year of study"
+        study_year = int(row["year_of_study"])
+    else:
+        study_year = year_of_study(year_joined)
+
+    subjects = sorted({code.strip() for code in row["subjects"] if code.strip()})
+
+    return {
+        "reg_no": reg_no,
+        "roll_no": row["roll_no"] or f"{year_joined}{dept['abbr']}{reg_no[-2:]}",
+        "name": row["name"],
+        "department_id": dept["id"],
+        "year_joined": year_joined,
+        "year_of_study": study_year,
+        "student_type": row["student_type"],
+        "subjects_registered": ",".join(subjects) or None,
+    }, None
+
+
+def _chunks(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_students(rows: Iterable[Dict[str, Any]], departments: List[Dict[str, Any]],
+                    write_chunk: Callable[..., Any],
+                    chunk_size: int = IMPORT_CHUNK_SIZE,
+                    columns: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    """
+    Validate rows chunk by chunk and hand each chunk of records to `write_chunk`
+    (a batched upsert keyed on reg_no). With `columns`, `write_chunk(records, columns)`
+    must only change those columns for students that already exist, and returns
+    the reg_nos it could not write: new students whose name is None.
+    Returns a per-chunk throughput report.
+    """
+    lookup = {}
+    for dept in departments:
+        lookup[dept["abbr"]] = dept
+        lookup[dept["code"]] = dept
+
+    received = 0
+    imported = 0
+    rejected = 0
+    errors = []
+    chunks = []
+    started = time.perf_counter()
+
+    for number, chunk in enumerate(_chunks(rows, max(1, chunk_size)), start=1):
+        chunk_started = time.perf_counter()
+        # Keyed on reg_no so a repeated row inside one chunk cannot hit the same key twice
+        records = {}
+        row_of = {}
+        for offset, row in enumerate(chunk):
+            record, error = validate_row(row, lookup)
+            if error:
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": received + offset + 1, "regNo": row.get("reg_no"), "error": error})
+                continue
+            records[record["reg_no"]] = record
+            row_of[record["reg_no"]] = received + offset + 1
+        received += len(chunk)
+
+        if records:
+            skipped = []
+            if columns is None:
+                write_chunk(list(records.values()))
+            else:
+                skipped = write_chunk(list(records.values()), columns) or []
+            for reg_no in skipped:
+                del records[reg_no]
+                rejected += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": row_of[reg_no], "regNo": reg_no, "error": "missing name"})
+            imported += len(records)
+
+        seconds = time.perf_counter() - chunk_started
+        chunks.append({
+            "chunk": number,
+            "rows": len(chunk),
+            "imported": len(records),
+            "seconds": round(seconds, 4),
+            "rowsPerSecond": round(len(chunk) / seconds) if seconds else None,
+        })
+
+    seconds = time.perf_counter() - started
+    return {
+        "received": received,
+        "imported": imported,
+        "rejected": rejected,
+        "errors": errors,
+        "chunks": chunks,
+        "seconds": round(seconds, 4),
+        "rowsPerSecond": round(received / seconds) if seconds else None,
+    }
@@ -1,179 +1,182 @@
-<<<<<<< HEAD
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import multiprocessing
+import os
 import random
 
-from models import Student, Exam, Hall, Allotment, db
+from models import StudentSubject, Exam, Hall, Allotment, Student, db
+from services.registrations import RegistrationMatrix
+from services.seating import assign_seats
+from services.validator import describe, status, summarize, validate_plan
+
+
+def load_registrations(exam_ids: List[int]) -> RegistrationMatrix:
+    """Load every candidate for the given exams with one indexed join on student_subjects."""
+    if not exam_ids:
+        return RegistrationMatrix([])
+    rows = (
+        db.session.query(StudentSubject.subject_code, StudentSubject.student_id)
+        .join(Exam, Exam.subject_code == StudentSubject.subject_code)
+        .filter(Exam.id.in_(exam_ids))
+        .distinct()
+    )
+    return RegistrationMatrix(rows)
+
+
+def group_exam_slots(exams: Iterable[Dict[str, Any]], date_str: Optional[str] = None,
+                     session_str: Optional[str] = None) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    """Group exam dicts (id, date, session, subject_code) by (date, session), optionally filtered."""
+    slots: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    for exam in exams:
+        date, session = str(exam["date"]), exam["session"]
+        if date_str and date != date_str:
+            continue
+        if session_str and session != session_str:
+            continue
+        slots.setdefault((date, session), []).append(
+            {"id": exam["id"], "subject_code": exam["subject_code"]}
+        )
+    return slots
 
 
-def run_allotment(date_str: Optional[str] = None, session_str: Optional[str] = None):
+def exam_groups(exams: List[Dict[str, Any]], candidates: Dict[str, List[int]]
+                ) -> Tuple[Dict[int, List[int]], Dict[int, List[str]]]:
     """
-    Runs exam-based allotment algorithm.
-    If date_str/session_str provided, runs only for that slot.
-    Returns a dict with status/log.
+    One seating group per exam, so neighbours never write the same paper. A student
+    registered for several of the slot's exams is seated once, for the first of them.
+    Returns (exam id -> student ids, student id -> every subject code they sit).
+    """
+    groups: Dict[int, List[int]] = {}
+    exams_of: Dict[int, List[str]] = {}
+    for exam in exams:
+        members = []
+        for student in candidates.get(exam["subject_code"], []):
+            if student not in exams_of:
+                members.append(student)
+            exams_of.setdefault(student, []).append(exam["subject_code"])
+        if members:
+            groups[exam["id"]] = members
+    return groups, exams_of
+
+
+def plan_slot(slot: Tuple[str, str], exams: List[Dict[str, Any]], candidates: Dict[str, List[int]],
+              halls: List[Dict[str, Any]], seed: Optional[int] = None) -> Dict[str, Any]:
     """
-    all_exams = Exam.query.all()
-    slots = {}
+    Compute the seating for one (date, session) slot without touching the database.
+    `candidates` maps the slot's subject codes to registered student ids.
+    """
+    date, session = slot
+    rng = random.Random(f"{seed}:{date}:{session}") if seed is not None else random.Random()
 
-    for exam in all_exams:
-        key = (exam.date, exam.session)
-        slots.setdefault(key, []).append(exam)
+    groups, exams_of = exam_groups(exams, candidates)
+    for members in groups.values():
+        rng.shuffle(members)
+    clashes = [{"student_id": student, "subjects": codes} for student, codes in exams_of.items() if len(codes) > 1]
 
-    log = []
+    # Seats no other paper can take are filled rather than leaving students without one
+    result = assign_seats(halls, groups, fill_blocked=True)
+    rows = [
+        {"student_id": student, "exam_id": exam_id, "hall_id": hall["id"], "seat_number": seat + 1}
+        for hall, seat, exam_id, student in result["plan"].placements()
+    ]
 
-    halls = Hall.query.all()
-    if not halls:
-        return {"status": "error", "message": "No halls configured"}
+    log = [
+        f"Processing Slot: {date} {session}",
+        f"  Found {len(exams_of)} students to seat.",
+    ]
+    if clashes:
+        log.append(f"  ⚠️ {len(clashes)} students have more than one exam in this slot; seated once, for the first")
+    if result["forced"]:
+        log.append(f"  ⚠️ {result['forced']} students seated next to the same paper - add halls to avoid this")
+    if result["unseated"]:
+        log.append(f"  ❌ CRITICAL: Run out of seats! {len(result['unseated'])} students unseated.")
 
-    for (date, session), exams in slots.items():
-        if date_str and str(date) != date_str:
-            continue
-        if session_str and session != session_str:
-            continue
+    validation = validate_plan(result["plan"], expected=exams_of)
+    log.append(f"  {describe(validation)}")
 
-        log.append(f"Processing Slot: {date} {session}")
+    return {"slot": slot, "exam_ids": [exam["id"] for exam in exams], "rows": rows, "log": log,
+            "validation": validation, "clashes": clashes}
 
-        exam_subject_map = {e.subject_code: e for e in exams}
-        target_subjects = set(exam_subject_map.keys())
 
-        students_to_seat = []
-        all_students = Student.query.all()
-        for student in all_students:
-            if not student.subjects_registered:
-                continue
-            student_subs = set(student.subjects_registered.split(","))
-            overlap = student_subs.intersection(target_subjects)
-            for sub in overlap:
-                exam = exam_subject_map[sub]
-                students_to_seat.append({"student": student, "exam": exam})
+def _plan_slot_job(job):
+    return plan_slot(*job)
 
-        log.append(f"  Found {len(students_to_seat)} students to seat.")
-        if not students_to_seat:
-            continue
 
-        random.shuffle(students_to_seat)
+def plan_slots(slots: Dict[Tuple[str, str], List[Dict[str, Any]]], registrations: RegistrationMatrix,
+               halls: List[Dict[str, Any]], workers: int = 1, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Plan every slot, serially or across a process pool.
+    Plans come back in slot order and are identical either way for a fixed seed.
+    The pool is capped at the CPU count and spawns fresh interpreters, since
+    forking a threaded server process can copy a held lock into the child.
+    """
+    jobs = []
+    for slot in sorted(slots):
+        exams = slots[slot]
+        candidates = registrations.subject_index(e["subject_code"] for e in exams)
+        jobs.append((slot, exams, candidates, halls, seed))
 
-        hall_idx = 0
-        current_hall_filled = 0
+    workers = min(workers, os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(_plan_slot_job, jobs))
+    return [_plan_slot_job(job) for job in jobs]
 
-=======
-from sqlalchemy.orm import Session
-from models import Student, Exam, Hall, Allotment
-from typing import List, Dict
-import random
 
-def run_allotment(db: Session, date_str: str = None, session_str: str = None):
+def run_allotment(date_str: Optional[str] = None, session_str: Optional[str] = None,
+                  workers: int = 1, seed: Optional[int] = None):
     """
-    Runs the allotment algorithm.
+    Runs exam-based allotment algorithm.
     If date_str/session_str provided, runs only for that slot.
-    Otherwise runs for all exams in DB.
+    With workers > 1 the slots are planned in parallel; all plans are
+    written in a single transaction either way.
+    Every slot plan is validated first: a plan that seats someone twice or
+    overfills a hall is not written ("error"), one that breaks adjacency or
+    leaves candidates unseated is written but reported as "partial".
+    Returns a dict with status/log/validation.
     """
-    
-    # query exams
-    query = db.query(Exam)
-    # We are storing dates as DATE objects in DB, but for now assuming string match logic 
-    # or relying on the upload parsing. 
-    # To keep it robust, let's fetch ALL exams and filter in python or iterate by unique date/session.
-    
-    all_exams = query.all()
-    
-    # Group exams by (Date, Session)
-    slots = {}
-    for exam in all_exams:
-        key = (exam.date, exam.session)
-        if key not in slots:
-            slots[key] = []
-        slots[key].append(exam)
-        
-    log = []
-    
-    # Fetch Halls
-    halls = db.query(Hall).all()
+    exams = [
+        {"id": e.id, "date": e.date, "session": e.session, "subject_code": e.subject_code}
+        for e in Exam.query.all()
+    ]
+    slots = group_exam_slots(exams, date_str, session_str)
+
+    halls = [
+        {"id": h.id, "capacity": h.capacity, "rows": h.rows, "cols": h.cols}
+        for h in Hall.query.order_by(Hall.id).all()
+    ]
     if not halls:
         return {"status": "error", "message": "No halls configured"}
 
-    # Process each slot
-    for (date, session), exams in slots.items():
-        if date_str and str(date) != date_str: continue
-        if session_str and session != session_str: continue
-        
-        log.append(f"Processing Slot: {date} {session}")
-        
-        # 1. Identify Students for this slot
-        # We need to find students who have any of the subject codes in `exams` in their `subjects_registered`
-        exam_subject_map = {e.subject_code: e for e in exams}
-        target_subjects = set(exam_subject_map.keys())
-        
-        # Inefficient to query all students, but for <5000 students it's fine for SQLite.
-        # Optimized approach: User `like` query if possible, but comma separation makes it hard.
-        all_students = db.query(Student).all()
-        
-        students_to_seat = []
-        for student in all_students:
-            if not student.subjects_registered: continue
-            
-            # Check overlap
-            student_subs = set(student.subjects_registered.split(","))
-            overlap = student_subs.intersection(target_subjects)
-            
-            for sub in overlap:
-                # Student needs a seat for this subject
-                exam = exam_subject_map[sub]
-                students_to_seat.append({
-                    "student": student,
-                    "exam": exam
-                })
-        
-        log.append(f"  Found {len(students_to_seat)} students to seat.")
-        
-        if not students_to_seat:
-            continue
+    # Registrations are read once per run and shared by every slot
+    registrations = load_registrations([e["id"] for exams in slots.values() for e in exams])
+    if not registrations.subjects and Student.query.filter(Student.subjects_registered.isnot(None)).first():
+        return {"status": "error",
+                "message": "No student_subjects rows yet; run `flask --app app backfill-subjects` first"}
 
-        # 2. Clear existing allotments for this slot?
-        # Ideally yes, to avoid duplicates or re-run issues.
-        # db.query(Allotment).filter(Allotment.exam_id.in_([e.id for e in exams])).delete(synchronize_session=False)
-
-        # 3. Sort/Shuffle students
-        # To prevent malpractice, maybe shuffle? Or sort by RegNo?
-        # Let's shuffle for "Randomized Seating" logic usually desired.
-        random.shuffle(students_to_seat)
-        
-        # 4. Fill Halls
-        hall_idx = 0
-        current_hall_filled = 0
-        
->>>>>>> 2d8beaa9fd737bb6d330f13204e5079f2524bfcb
-        for item in students_to_seat:
-            if hall_idx >= len(halls):
-                log.append("  ❌ CRITICAL: Run out of seats!")
-                break
-
-            hall = halls[hall_idx]
-
-            if current_hall_filled >= hall.capacity:
-                hall_idx += 1
-                current_hall_filled = 0
-                if hall_idx >= len(halls):
-                    log.append("  ❌ CRITICAL: Run out of seats!")
-                    break
-                hall = halls[hall_idx]
-
-            existing = Allotment.query.filter_by(
-                student_id=item["student"].id,
-                exam_id=item["exam"].id,
-            ).first()
-
-            if not existing:
-                allotment = Allotment(
-                    student_id=item["student"].id,
-                    exam_id=item["exam"].id,
-                    hall_id=hall.id,
-                    seat_number=current_hall_filled + 1,
-                )
-                db.session.add(allotment)
-                current_hall_filled += 1
-
-        db.session.commit()
-
-    return {"status": "success", "log": log}
-
-    return {"status": "success", "log": log}
+    plans = plan_slots(slots, registrations, halls, workers=workers, seed=seed)
+
+    log = []
+    exam_ids = []
+    rows = []
+    for plan in plans:
+        log.extend(plan["log"])
+        exam_ids.extend(plan["exam_ids"])
+        rows.extend(plan["rows"])
+
+    validation = summarize(plan["validation"] for plan in plans)
+    outcome = status(validation)
+    report = {"status": outcome, "log": log, "validation": validation,
+              "clashes": sum(len(plan["clashes"]) for plan in plans)}
+    if outcome == "error":
+        return {**report, "message": f"Plan not written. {describe(validation)}", "allocated": 0}
+
+    # Re-running replaces the selected slots' allotments wholesale
+    if exam_ids:
+        Allotment.query.filter(Allotment.exam_id.in_(exam_ids)).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Allotment, rows)
+    db.session.commit()
+
+    if outcome == "partial":
+        report["message"] = f"Plan written with problems. {describe(validation)}"
+    return {**report, "allocated": len(rows)}
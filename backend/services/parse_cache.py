@@ -0,0 +1,134 @@
+"""
+Persistent cache for PDF parsing, kept in a small SQLite file under instance/.
+
+Two kinds of entries share one size budget:
+- parsed rows for a whole file, keyed by the SHA-256 of its bytes and the parser version
+- extracted text for a single page, keyed by a hash of that page's content stream
+Least recently used entries are evicted once the stored total exceeds the budget.
+The cache never breaks parsing: any storage error is reported and treated as a miss.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PARSE_CACHE_PATH = os.getenv(
+    "PARSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "parse_cache.db"),
+)
+
+# Bytes of cached rows and page text kept on disk
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def file_digest(source) -> Tuple[str, bytes]:
+    """SHA-256 hex digest and bytes of a path or seekable binary stream"""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+        source.seek(0)
+    return hashlib.sha256(data).hexdigest(), data
+
+
+class ParseCache:
+    def __init__(self, path: str = PARSE_CACHE_PATH, max_bytes: int = PARSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """One short-lived connection per operation, committed on success"""
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            if not self._ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_used_at ON entries(used_at)")
+                self._ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Stored values for whichever of `keys` are present; touches them for LRU"""
+        if not keys:
+            return {}
+        found = {}
+        try:
+            with self._lock, self._connect() as conn:
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    found.update(conn.execute(f"SELECT key, value FROM entries WHERE key IN ({marks})", chunk))
+                if found:
+                    now = time.time()
+                    conn.executemany("UPDATE entries SET used_at = ? WHERE key = ?", [(now, k) for k in found])
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Parse cache read failed: {exc}")
+            return {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, str]]):
+        """Store (key, value) pairs, then evict the least recently used past max_bytes"""
+        now = time.time()
+        rows = [(key, value, len(value.encode("utf-8")), now) for key, value in items]
+        if not rows:
+            return
+        try:
+            with self._lock, self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO entries (key, value, size, used_at) VALUES (?, ?, ?, ?)", rows)
+                self._evict(conn)
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Parse cache write failed: {exc}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY used_at"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def get_rows(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        value = self.get_many([key]).get(key)
+        return json.loads(value) if value is not None else None
+
+    def put_rows(self, key: str, rows: List[Dict[str, Any]]):
+        self.put_many([(key, json.dumps(rows))])
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            with self._lock, self._connect() as conn:
+                entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        except (OSError, sqlite3.Error):
+            entries, size = 0, 0
+        return {"entries": entries, "bytes": size, "maxBytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute("DELETE FROM entries")
+        except (OSError, sqlite3.Error) as exc:
+            print(f"Parse cache clear failed: {exc}")
@@ -1,131 +1,302 @@
+import hashlib
+import os
 import re
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+import pypdf
 from pypdf import PdfReader
 
+from services.parse_cache import PARSE_CACHE_MAX_BYTES, ParseCache, file_digest
+
+# Bump whenever parsed output changes so rows cached by an older parser are ignored
+PARSER_VERSION = 1
+
+TIMETABLE_CODE_PATTERN = re.compile(r"^([A-Z]{2}\d{2}[A-Z]\d{2}|[A-Z]{2,3}\d{3,4})$")
+TIMETABLE_DATE_PATTERN = re.compile(r"^(\d{1,2}-(?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)-\d{2,4})$", re.IGNORECASE)
+TIMETABLE_SESSION_PATTERN = re.compile(r"^(F\.N\.|A\.N\.)$", re.IGNORECASE)
+TIMETABLE_SKIP_WORDS = [
+    "page", "branch", "semester", "regulation", "choice based",
+    "anna university", "time table", "controller", "examinations",
+    "cbcs", "forenoon", "afternoon", "subject name", "exam date"
+]
+
+STUDENT_BLOCK_PATTERN = re.compile(r"Register\s*Number\s*\d{10,15}", re.IGNORECASE)
+STUDENT_REG_PATTERN = re.compile(r"Register\s*Number\s*(\d{10,15})", re.IGNORECASE)
+STUDENT_NAME_PATTERN = re.compile(
+    r"(?:Name|me)\s*(?:of\s*(?:the\s*)?Candidate)?\s*[:\s]*([A-Z][A-Z\s\.]+?)(?:\s*Date\s*of\s*Birth|$)",
+    re.IGNORECASE,
+)
+STUDENT_NAME_TAIL_PATTERN = re.compile(r"\s*(Date|Degree|Branch|Semester|Regulations).*$", re.IGNORECASE)
+STUDENT_DEPT_PATTERN = re.compile(
+    r"(?:Degree|ree)\s*&?\s*Branch\s*[:\s]*(B\.?E\.?|B\.?Tech\.?|M\.?E\.?|M\.?Tech\.?)\s*\.?\s*([A-Za-z\s&\(\)]+?)(?:\s*Reg|\s*Sem|$)",
+    re.IGNORECASE,
+)
+STUDENT_SUBJECT_PATTERN = re.compile(r"\b([A-Z]{2}\d{2}[A-Z]?\d{2}|[A-Z]{2,3}\d{3,4})\b")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Characters kept from a page with no "Register Number" so a header split across pages still matches
+BLOCK_HEADER_OVERLAP = 64
+
+# Timetables shorter than this are parsed in-process; the pool start-up is not worth it
+PARALLEL_PAGE_THRESHOLD = 8
+
+# Freshly extracted page texts written to the parse cache per transaction
+CACHE_WRITE_BATCH = 16
+
+# Per-worker-process readers and caches, so each worker opens a given PDF or cache only once
+_worker_readers: Dict[str, PdfReader] = {}
+_worker_caches: Dict[Tuple[str, int], ParseCache] = {}
+
+
+def _parse_timetable_page(text: str) -> List[Dict[str, Any]]:
+    """Pair up the codes, names, dates and sessions found on one timetable page."""
+    page_names: List[str] = []
+    page_codes: List[str] = []
+    page_dates: List[str] = []
+    page_sessions: List[str] = []
+
+    for line in text.split("\n"):
+        clean = line.strip()
+        if not clean:
+            continue
+
+        if TIMETABLE_CODE_PATTERN.match(clean):
+            page_codes.append(clean)
+        elif TIMETABLE_DATE_PATTERN.match(clean):
+            page_dates.append(clean.upper())
+        elif TIMETABLE_SESSION_PATTERN.match(clean):
+            page_sessions.append(clean.upper().replace(".", "").replace(" ", ""))
+        elif line.startswith("  ") and len(clean) > 3:
+            lower = clean.lower()
+            if not any(skip in lower for skip in TIMETABLE_SKIP_WORDS):
+                if clean[0].isalpha():
+                    page_names.append(clean)
+
+    return [
+        {
+            "date": page_dates[i] if i < len(page_dates) else "UNKNOWN",
+            "session": page_sessions[i] if i < len(page_sessions) else "FN",
+            "subject_code": code,
+            "subject_name": page_names[i] if i < len(page_names) else "Unknown",
+        }
+        for i, code in enumerate(page_codes)
+    ]
+
+
+def _load_page(page, cache: Optional[ParseCache],
+               parse: Optional[Callable[[str], Any]]) -> Tuple[Optional[str], str, bool, Any]:
+    """(cache key, text, extracted now rather than cached, parse(text)) for one page."""
+    key = page_key(page) if cache is not None else None
+    text = cache.get_many([key]).get(key) if cache is not None else None
+    extracted = text is None
+    if extracted:
+        text = page.extract_text()
+    return key, text, extracted, parse(text) if parse else None
+
+
+def _load_page_at(job) -> Tuple[Optional[str], str, bool, Any]:
+    """Worker entry point: _load_page for page `index` of `file_path`, reading the cache at `cache_at`."""
+    file_path, index, cache_at, parse = job
+    reader = _worker_readers.get(file_path)
+    if reader is None:
+        reader = _worker_readers[file_path] = PdfReader(file_path)
+    cache = None
+    if cache_at is not None:
+        cache = _worker_caches.get(cache_at)
+        if cache is None:
+            cache = _worker_caches[cache_at] = ParseCache(*cache_at)
+    return _load_page(reader.pages[index], cache, parse)
+
+
+def page_key(page) -> str:
+    """
+    Cache key for a page's extracted text: its decoded content stream plus the
+    fonts it draws with, under the installed pypdf version.
+    """
+    digest = hashlib.sha256(f"pypdf {pypdf.__version__}".encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    fonts = resources.get_object().get("/Font") if resources is not None else None
+    if fonts is not None:
+        fonts = fonts.get_object()
+        for name in sorted(fonts):
+            digest.update(f"{name}={fonts[name].get_object().get('/BaseFont')}".encode())
+    return f"page:{digest.hexdigest()}"
+
+
+def _parse_student_block(block: str) -> Optional[Dict[str, Any]]:
+    """Parse one "Register Number ..." block of a nominal roll into a student dict."""
+    reg_match = STUDENT_REG_PATTERN.search(block)
+    if not reg_match:
+        return None
+
+    reg_no = reg_match.group(1)
+
+    # None when the name cannot be read, so an import keeps the stored one
+    name = None
+    name_match = STUDENT_NAME_PATTERN.search(block)
+    if name_match:
+        name = STUDENT_NAME_TAIL_PATTERN.sub("", name_match.group(1).strip()).strip() or None
+
+    dept_match = STUDENT_DEPT_PATTERN.search(block)
+    if dept_match:
+        degree = dept_match.group(1).replace(".", "").upper()
+        branch = WHITESPACE_PATTERN.sub(" ", dept_match.group(2).strip()).strip()
+        department = f"{degree} {branch}"
+    else:
+        department = "Unknown"
+
+    subjects = STUDENT_SUBJECT_PATTERN.findall(block)
+    subjects = list(set([s for s in subjects if len(s) >= 6]))
+
+    return {
+        "reg_no": reg_no,
+        "name": name,
+        "department": department,
+        "registered_subjects": subjects,
+    }
+
+
+def iter_student_blocks(page_texts: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield students from page texts as soon as each block is complete.
+    The block still open at a page break is carried over to the next page.
+    """
+    carry = ""
+    for text in page_texts:
+        buffer = carry + text + "\n"
+        starts = [m.start() for m in STUDENT_BLOCK_PATTERN.finditer(buffer)]
+        for begin, end in zip(starts, starts[1:]):
+            student = _parse_student_block(buffer[begin:end])
+            if student:
+                yield student
+        carry = buffer[starts[-1]:] if starts else buffer[-BLOCK_HEADER_OVERLAP:]
+
+    if carry:
+        student = _parse_student_block(carry)
+        if student:
+            yield student
+
+
 class PDFParser:
-    def extract_text(self, file_path: str) -> str:
-        """Extract raw text from PDF."""
-        text = ""
-        try:
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        except Exception as exc:
-            print(f"Error extracting text: {exc}")
-        return text
+    def __init__(self, workers: Optional[int] = None, cache: Optional[ParseCache] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
 
-    def parse_timetable(self, file_path: str) -> List[Dict[str, Any]]:
-        """Parse timetable PDF by processing each page separately."""
+    def _pages(self, file_path, workers: Optional[int] = None,
+               parse: Optional[Callable[[str], Any]] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        Yield (text, parse(text)) for each page in order, as soon as that page is ready.
+        Cached pages skip extraction. Large PDFs on disk are hashed, extracted and parsed
+        page by page across a process pool; fresh texts are cached as they arrive.
+        """
+        workers = workers or self.workers
         reader = PdfReader(file_path)
-        parsed_exams: List[Dict[str, Any]] = []
-        seen_codes = set()
-
-        code_pattern = re.compile(r"^([A-Z]{2}\d{2}[A-Z]\d{2}|[A-Z]{2,3}\d{3,4})$")
-        date_pattern = re.compile(r"^(\d{1,2}-(?:JAN|FEB|MAR|APR|MAY|JUN|JUL|AUG|SEP|OCT|NOV|DEC)-\d{2,4})$", re.IGNORECASE)
-        session_pattern = re.compile(r"^(F\.N\.|A\.N\.)$", re.IGNORECASE)
-
-        for page in reader.pages:
-            text = page.extract_text()
-            lines = text.split("\n")
-
-            page_names: List[str] = []
-            page_codes: List[str] = []
-            page_dates: List[str] = []
-            page_sessions: List[str] = []
-
-            for line in lines:
-                clean = line.strip()
-                if not clean:
-                    continue
-
-                if code_pattern.match(clean):
-                    page_codes.append(clean)
-                elif date_pattern.match(clean):
-                    page_dates.append(clean.upper())
-                elif session_pattern.match(clean):
-                    page_sessions.append(clean.upper().replace(".", "").replace(" ", ""))
-                elif line.startswith("  ") and len(clean) > 3:
-                    lower = clean.lower()
-                    if not any(skip in lower for skip in [
-                        "page", "branch", "semester", "regulation", "choice based",
-                        "anna university", "time table", "controller", "examinations",
-                        "cbcs", "forenoon", "afternoon", "subject name", "exam date"
-                    ]):
-                        if clean[0].isalpha():
-                            page_names.append(clean)
-
-            for i, code in enumerate(page_codes):
-                if code in seen_codes:
-                    continue
-                seen_codes.add(code)
-
-                name = page_names[i] if i < len(page_names) else "Unknown"
-                date = page_dates[i] if i < len(page_dates) else "UNKNOWN"
-                session = page_sessions[i] if i < len(page_sessions) else "FN"
-
-                parsed_exams.append({
-                    "date": date,
-                    "session": session,
-                    "subject_code": code,
-                    "subject_name": name,
-                })
-
-        return parsed_exams
+        pages = reader.pages
+        pool = None
+        if workers > 1 and len(pages) >= PARALLEL_PAGE_THRESHOLD and isinstance(file_path, str):
+            cache_at = (self.cache.path, self.cache.max_bytes) if self.cache is not None else None
+            jobs = [(file_path, i, cache_at, parse) for i in range(len(pages))]
+            pool = ProcessPoolExecutor(max_workers=workers)
+            results = pool.map(_load_page_at, jobs, chunksize=max(1, len(jobs) // (workers * 16)))
+        else:
+            results = (_load_page(page, self.cache, parse) for page in pages)
 
-    def parse_student_list(self, file_path: str) -> List[Dict[str, Any]]:
-        """Parse student list PDF using regex."""
-        text = self.extract_text(file_path)
-        parsed_students: List[Dict[str, Any]] = []
+        fresh = []
+        try:
+            for key, text, extracted, parsed in results:
+                if key is not None:
+                    if pool is not None:
+                        # Worker lookups count against their own cache objects
+                        self.cache.hits += not extracted
+                        self.cache.misses += extracted
+                    if extracted:
+                        fresh.append((key, text))
+                    if len(fresh) >= CACHE_WRITE_BATCH:
+                        self.cache.put_many(fresh)
+                        fresh = []
+                yield text, parsed
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if fresh:
+                self.cache.put_many(fresh)
 
-        reg_pattern = re.compile(r"Register\s*Number\s*(\d{10,15})", re.IGNORECASE)
-        name_pattern = re.compile(
-            r"(?:Name|me)\s*(?:of\s*(?:the\s*)?Candidate)?\s*[:\s]*([A-Z][A-Z\s\.]+?)(?:\s*Date\s*of\s*Birth|$)",
-            re.IGNORECASE,
-        )
-        dept_pattern = re.compile(
-            r"(?:Degree|ree)\s*&?\s*Branch\s*[:\s]*(B\.?E\.?|B\.?Tech\.?|M\.?E\.?|M\.?Tech\.?)\s*\.?\s*([A-Za-z\s&\(\)]+?)(?:\s*Reg|\s*Sem|$)",
-            re.IGNORECASE,
-        )
-        sub_pattern = re.compile(r"\b([A-Z]{2}\d{2}[A-Z]?\d{2}|[A-Z]{2,3}\d{3,4})\b")
+    def _page_texts(self, file_path, workers: Optional[int] = None) -> Iterator[str]:
+        """Yield each page's text in order."""
+        for text, _ in self._pages(file_path, workers):
+            yield text
 
-        blocks = re.split(r"(?=Register\s*Number\s*\d{10,15})", text, flags=re.IGNORECASE)
+    def iter_page_texts(self, file_path, errors: Optional[List[Exception]] = None) -> Iterator[str]:
+        """Yield the raw text of each PDF page in order; failures are reported, not raised."""
+        try:
+            yield from self._page_texts(file_path, workers=1)
+        except Exception as exc:
+            print(f"Error extracting text: {exc}")
+            if errors is not None:
+                errors.append(exc)
 
-        for block in blocks:
-            if not block.strip():
-                continue
+    def extract_text(self, file_path: str) -> str:
+        """Extract raw text from PDF."""
+        return "".join(text + "\n" for text in self.iter_page_texts(file_path))
 
-            reg_match = reg_pattern.search(block)
-            if not reg_match:
-                continue
+    def _rows_key(self, kind: str, file_path) -> Optional[str]:
+        """Whole-file cache key, or None when caching is off"""
+        if self.cache is None:
+            return None
+        digest, _ = file_digest(file_path)
+        return f"rows:{kind}:v{PARSER_VERSION}:{digest}"
 
-            reg_no = reg_match.group(1)
+    def _cached_rows(self, key: Optional[str], parse: Callable[[], Iterator[Dict[str, Any]]],
+                     errors: Optional[List[Exception]] = None) -> Iterator[Dict[str, Any]]:
+        """Replay cached rows for `key`, or stream `parse()` and store its rows once it completes cleanly."""
+        if key is None:
+            yield from parse()
+            return
+        rows = self.cache.get_rows(key)
+        if rows is not None:
+            yield from rows
+            return
+        rows = []
+        for row in parse():
+            rows.append(row)
+            yield row
+        if not errors:
+            self.cache.put_rows(key, rows)
 
-            name_match = name_pattern.search(block)
-            if name_match:
-                name = name_match.group(1).strip()
-                name = re.sub(r"\s*(Date|Degree|Branch|Semester|Regulations).*$", "", name, flags=re.IGNORECASE).strip()
-            else:
-                name = f"Student {reg_no}"
+    def iter_timetable(self, file_path: str, workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield timetable exams in page order, first occurrence of each subject code only.
+        Repeat uploads are answered from the parse cache; otherwise large PDFs are
+        extracted and parsed page-by-page across a process pool.
+        """
+        def parse():
+            seen_codes = set()
+            for _, exams in self._pages(file_path, workers, _parse_timetable_page):
+                for exam in exams:
+                    if exam["subject_code"] not in seen_codes:
+                        seen_codes.add(exam["subject_code"])
+                        yield exam
 
-            dept_match = dept_pattern.search(block)
-            if dept_match:
-                degree = dept_match.group(1).replace(".", "").upper()
-                branch = dept_match.group(2).strip()
-                branch = re.sub(r"\s+", " ", branch).strip()
-                department = f"{degree} {branch}"
-            else:
-                department = "Unknown"
+        return self._cached_rows(self._rows_key("timetable", file_path), parse)
 
-            subjects = sub_pattern.findall(block)
-            subjects = list(set([s for s in subjects if len(s) >= 6]))
+    def parse_timetable(self, file_path: str) -> List[Dict[str, Any]]:
+        """Parse timetable PDF by processing each page separately."""
+        return list(self.iter_timetable(file_path))
 
-            parsed_students.append({
-                "reg_no": reg_no,
-                "name": name,
-                "department": department,
-                "registered_subjects": subjects,
-            })
+    def iter_student_list(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream students out of a nominal-roll PDF page by page."""
+        errors: List[Exception] = []
+        return self._cached_rows(
+            self._rows_key("students", file_path),
+            lambda: iter_student_blocks(self.iter_page_texts(file_path, errors)),
+            errors,
+        )
 
-        return parsed_students
+    def parse_student_list(self, file_path: str) -> List[Dict[str, Any]]:
+        """Parse student list PDF using regex."""
+        return list(self.iter_student_list(file_path))
 
-parser_service = PDFParser()
+parser_service = PDFParser(cache=ParseCache() if PARSE_CACHE_MAX_BYTES > 0 else None)
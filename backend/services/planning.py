@@ -0,0 +1,77 @@
+"""
+Capacity planning: per-slot demand against what the seating engine can
+actually place, computed from the registration bitset without writing anything.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from services.logic import exam_groups
+from services.registrations import RegistrationMatrix
+from services.seating import assign_seats
+
+# One invigilator for every this many seated students in a hall (at least one per used hall)
+STUDENTS_PER_INVIGILATOR = 30
+
+
+def plan_capacity(slots: Dict[Tuple[str, str], List[Dict[str, Any]]],
+                  registrations: RegistrationMatrix,
+                  halls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Dry-run feasibility for every (date, session) slot.
+
+    Demand is the number of distinct students sitting any of the slot's
+    subjects; `clashes` counts students registered for more than one of them.
+    Each slot is dry-run through the seating engine with the neighbour rule
+    enforced, so `seatable` is what it can place without two neighbours
+    writing the same paper and `shortfall` is everyone else (the allotter
+    still seats them while seats last, but reports the plan as partial).
+    Invigilators are counted per block for the halls the dry run fills.
+    """
+    capacities = np.array([h.get("capacity") or 0 for h in halls], dtype=np.int64)
+    total_capacity = int(capacities.sum())
+    blocks = [(h.get("blocks") or {}).get("name") or str(h.get("block_id", "")) for h in halls]
+    block_names = sorted(set(blocks))
+    block_index = np.array([block_names.index(b) for b in blocks], dtype=np.intp)
+    typical_hall = int(np.median(capacities)) if len(capacities) else 0
+
+    report = []
+    for slot in sorted(slots):
+        date, session = slot
+        codes = sorted({e["subject_code"] for e in slots[slot]})
+        demand, clashes = registrations.headcount(codes)
+
+        groups, _ = exam_groups(slots[slot], registrations.subject_index(codes))
+        result = assign_seats(halls, groups)
+        filled = np.zeros(len(halls), dtype=np.int64)
+        filled[:len(result["halls"])] = [summary["filled"] for summary in result["halls"]]
+        invigilators = np.where(filled > 0, np.maximum(1, -(-filled // STUDENTS_PER_INVIGILATOR)), 0)
+        per_block = np.bincount(block_index, weights=invigilators, minlength=len(block_names))
+
+        shortfall = len(result["unseated"])
+        report.append({
+            "date": date,
+            "session": session,
+            "subjects": len(codes),
+            "demand": demand,
+            "clashes": clashes,
+            "capacity": total_capacity,
+            "seatable": demand - shortfall,
+            "shortfall": shortfall,
+            "utilization": round(min(demand, total_capacity) / total_capacity, 4) if total_capacity else None,
+            "hallsUsed": int(np.count_nonzero(filled)),
+            # Whatever is left over is one paper, which takes every other seat of a hall
+            "extraHalls": -(-shortfall // -(-typical_hall // 2)) if shortfall and typical_hall else 0,
+            "invigilators": {name: int(n) for name, n in zip(block_names, per_block) if n},
+        })
+
+    return {
+        "slots": report,
+        "halls": len(halls),
+        "capacity": total_capacity,
+        "typicalHallCapacity": typical_hall,
+        "feasible": all(r["shortfall"] == 0 for r in report),
+        "peakDemand": max((r["demand"] for r in report), default=0),
+        "totalShortfall": sum(r["shortfall"] for r in report),
+    }
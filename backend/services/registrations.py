@@ -0,0 +1,101 @@
+"""
+Student x subject registrations as a packed bitset.
+
+Each subject is one row of bits, one bit per student (eight students per
+byte), built once from (subject_code, student_id) pairs. A slot's candidates
+are the OR of its subject rows and its clashes (students registered for two
+or more of its subjects) fall out of the same OR pass, so headcounts and
+clash reports for a whole exam series are array operations over a few bytes
+per student and subject.
+"""
+
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# Set bits per byte value
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.int64)
+
+# Students named in a slot's clash report ("clashes" is the full count)
+MAX_CLASHES_LISTED = 200
+
+
+class RegistrationMatrix:
+    def __init__(self, registrations: Iterable[Tuple[str, int]]):
+        pairs = list(registrations)
+        self.subjects: List[str] = sorted({code for code, _ in pairs})
+        self.student_ids = np.array(sorted({student_id for _, student_id in pairs}), dtype=np.int64)
+        self.row_of = {code: i for i, code in enumerate(self.subjects)}
+
+        self.bits = np.zeros((len(self.subjects), -(-len(self.student_ids) // 8)), dtype=np.uint8)
+        if pairs:
+            rows = np.fromiter((self.row_of[code] for code, _ in pairs), dtype=np.intp, count=len(pairs))
+            ids = np.fromiter((student_id for _, student_id in pairs), dtype=np.int64, count=len(pairs))
+            cols = np.searchsorted(self.student_ids, ids)
+            np.bitwise_or.at(self.bits, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes + self.student_ids.nbytes
+
+    def _rows(self, codes: Iterable[str]) -> np.ndarray:
+        return np.array(sorted({self.row_of[code] for code in codes if code in self.row_of}), dtype=np.intp)
+
+    def _ids(self, bits: np.ndarray) -> List[int]:
+        return self.student_ids[np.flatnonzero(np.unpackbits(bits, count=len(self.student_ids)))].tolist()
+
+    def members(self, code: str) -> List[int]:
+        """Student ids registered for a subject, ascending"""
+        row = self.row_of.get(code)
+        return self._ids(self.bits[row]) if row is not None else []
+
+    def subject_index(self, codes: Iterable[str]) -> Dict[str, List[int]]:
+        """subject code -> registered student ids, for the codes that have any"""
+        return {code: self.members(code) for code in sorted(set(codes)) if code in self.row_of}
+
+    def slot_bits(self, codes: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(sitting, clashing) bit rows for a slot's subjects, in one OR pass over them"""
+        sitting = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        clashing = np.zeros_like(sitting)
+        for row in self._rows(codes):
+            clashing |= sitting & self.bits[row]
+            sitting |= self.bits[row]
+        return sitting, clashing
+
+    def headcount(self, codes: Iterable[str]) -> Tuple[int, int]:
+        """(students sitting, students with more than one exam) for a slot's subjects"""
+        sitting, clashing = self.slot_bits(codes)
+        return int(POPCOUNT[sitting].sum()), int(POPCOUNT[clashing].sum())
+
+    def clash_report(self, slots: Dict[Tuple[str, str], Sequence[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        Per (date, session) slot: headcount and every student registered for two or
+        more of its subjects, with those subject codes. Slots are in (date, session) order.
+        """
+        report = []
+        for slot in sorted(slots):
+            date, session = slot
+            codes = sorted({exam["subject_code"] for exam in slots[slot]})
+            rows = self._rows(codes)
+            sitting, clashing = self.slot_bits(codes)
+
+            # Test just the clashing columns against each of the slot's subject rows
+            cols = np.flatnonzero(np.unpackbits(clashing, count=len(self.student_ids)))
+            listed = cols[:MAX_CLASHES_LISTED]
+            held = (self.bits[np.ix_(rows, listed >> 3)] & (0x80 >> (listed & 7)).astype(np.uint8)) != 0
+            students = [
+                {"student_id": int(self.student_ids[col]),
+                 "subjects": [self.subjects[rows[i]] for i in np.flatnonzero(held[:, j]).tolist()]}
+                for j, col in enumerate(listed.tolist())
+            ]
+
+            report.append({
+                "date": date,
+                "session": session,
+                "subjects": len(codes),
+                "headcount": int(POPCOUNT[sitting].sum()),
+                "clashes": len(cols),
+                "students": students,
+            })
+        return report
+
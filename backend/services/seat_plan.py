@@ -0,0 +1,138 @@
+"""
+Hall geometry and the compact seat plan shared by the allocators and the
+read endpoints.
+
+A SeatPlan keeps every seat of every hall in one int32 array holding an
+index into `plan.students` (-1 for an empty seat). Hall i owns the slice
+offsets[i]:offsets[i + 1], laid out row-major over its rows x cols grid,
+so rendering a hall is an array slice and a whole exam series of plans
+costs four bytes per seat plus one reference per seated student.
+"""
+
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_COLUMNS = 5
+
+EMPTY = -1
+
+
+def hall_shape(hall: Dict[str, Any]) -> Tuple[int, int]:
+    """Return (rows, cols) for a hall, deriving rows from capacity when not given."""
+    capacity = hall.get("capacity") or 0
+    cols = hall.get("cols") or DEFAULT_COLUMNS
+    rows = hall.get("rows") or -(-capacity // cols)
+    return rows, cols
+
+
+def usable_seats(hall: Dict[str, Any]) -> int:
+    """Seats that can be filled: the capacity, capped by the grid."""
+    rows, cols = hall_shape(hall)
+    return min(hall.get("capacity") or 0, rows * cols)
+
+
+def seat_position(seat: Optional[int], cols: Optional[int] = None) -> Tuple[Optional[int], Optional[int]]:
+    """1-based (row, col) of a row-major seat index, or (None, None) for no seat."""
+    if seat is None:
+        return None, None
+    cols = cols or DEFAULT_COLUMNS
+    return seat // cols + 1, seat % cols + 1
+
+
+class SeatPlan:
+    def __init__(self, halls: Iterable[Dict[str, Any]]):
+        self.halls: List[Dict[str, Any]] = list(halls)
+        self.positions = {hall["id"]: i for i, hall in enumerate(self.halls)}
+        shapes = [hall_shape(hall) for hall in self.halls]
+        self.rows = np.array([r for r, _ in shapes], dtype=np.int32)
+        self.cols = np.array([c for _, c in shapes], dtype=np.int32)
+        self.offsets = np.zeros(len(self.halls) + 1, dtype=np.int64)
+        np.cumsum([usable_seats(hall) for hall in self.halls], out=self.offsets[1:])
+        self.seats = np.full(int(self.offsets[-1]), EMPTY, dtype=np.int32)
+        self.students: List[Any] = []
+        self.groups: List[Hashable] = []
+        # (student, hall position or None, reason) for rows from_rows/from_halls could not seat
+        self.rejected: List[Tuple[Any, Optional[int], str]] = []
+
+    @classmethod
+    def from_rows(cls, halls: Iterable[Dict[str, Any]], students: Iterable[Dict[str, Any]],
+                  group=lambda student: None) -> "SeatPlan":
+        """Plan of student rows by hall_id/seat; unseated rows are skipped, unplaceable ones kept in `rejected`."""
+        plan = cls(halls)
+        for student in students:
+            if student.get("hall_id") is None:
+                continue
+            plan._load(plan.positions.get(student.get("hall_id")), student, group(student))
+        return plan
+
+    @classmethod
+    def from_halls(cls, halls: Iterable[Dict[str, Any]], group=lambda student: None) -> "SeatPlan":
+        """Plan of halls fetched with their seated students embedded under `students`."""
+        halls = list(halls)
+        plan = cls(halls)
+        for position, hall in enumerate(halls):
+            for student in hall.get("students") or []:
+                if student.get("seat") is not None:
+                    plan._load(position, student, group(student))
+        return plan
+
+    def _load(self, position: Optional[int], student: Dict[str, Any], group: Hashable):
+        """Seat a stored row, or record why it cannot be seated"""
+        seat = student.get("seat")
+        if position is None:
+            self.rejected.append((student, None, "unknown hall"))
+        elif seat is None or not 0 <= seat < self.capacity(position):
+            self.rejected.append((student, position, "outside hall"))
+        elif self.seats[self.offsets[position] + seat] != EMPTY:
+            self.rejected.append((student, position, "seat taken"))
+        else:
+            self.place(position, seat, self.add(student, group))
+
+    def add(self, student: Any, group: Hashable = None) -> int:
+        """Register a student and return its index"""
+        self.students.append(student)
+        self.groups.append(group)
+        return len(self.students) - 1
+
+    def place(self, position: int, seat: int, index: int):
+        self.seats[self.offsets[position] + seat] = index
+
+    def capacity(self, position: int) -> int:
+        return int(self.offsets[position + 1] - self.offsets[position])
+
+    def hall_seats(self, hall_id) -> np.ndarray:
+        """Student indices of one hall's seats, row-major (a view, not a copy)"""
+        position = self.positions[hall_id]
+        return self.seats[self.offsets[position]:self.offsets[position + 1]]
+
+    def grid(self, hall_id) -> np.ndarray:
+        """One hall as a rows x cols array, padded with EMPTY past its capacity"""
+        position = self.positions[hall_id]
+        rows, cols = int(self.rows[position]), int(self.cols[position])
+        grid = np.full(rows * cols, EMPTY, dtype=np.int32)
+        seats = self.hall_seats(hall_id)
+        grid[:len(seats)] = seats
+        return grid.reshape(rows, cols)
+
+    def filled(self) -> np.ndarray:
+        """Seated students per hall"""
+        taken = np.concatenate(([0], np.cumsum(self.seats != EMPTY)))
+        return taken[self.offsets[1:]] - taken[self.offsets[:-1]]
+
+    def placements(self) -> Iterator[Tuple[Dict[str, Any], int, Hashable, Any]]:
+        """(hall, seat, group, student) for every filled seat, hall by hall in seat order"""
+        for position, hall in enumerate(self.halls):
+            start = int(self.offsets[position])
+            seats = self.seats[start:int(self.offsets[position + 1])]
+            for seat in np.flatnonzero(seats != EMPTY).tolist():
+                index = int(seats[seat])
+                yield hall, seat, self.groups[index], self.students[index]
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.seats != EMPTY))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the seat arrays (student objects are shared, not copied)"""
+        return self.seats.nbytes + self.offsets.nbytes + self.rows.nbytes + self.cols.nbytes
@@ -0,0 +1,152 @@
+"""
+Seating engine: places groups of students into hall grids so that no two
+neighbouring seats hold the same group (department, subject code, ...).
+"""
+
+import heapq
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from services.seat_plan import SeatPlan, hall_shape, usable_seats
+
+
+def neighbours(seat: int, cols: int, usable: int, diagonal: bool = False) -> List[int]:
+    """Indices of the seats around `seat` in a row-major grid of `usable` seats."""
+    row, col = divmod(seat, cols)
+    steps = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+    if diagonal:
+        steps += [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+    result = []
+    for dr, dc in steps:
+        r, c = row + dr, col + dc
+        if r >= 0 and 0 <= c < cols and r * cols + c < usable:
+            result.append(r * cols + c)
+    return result
+
+
+def assign_seats(
+    halls: List[Dict[str, Any]],
+    groups: Dict[Hashable, List[Any]],
+    diagonal: bool = False,
+    occupied: Optional[Dict[Any, Dict[int, Hashable]]] = None,
+    fill_blocked: bool = False,
+) -> Dict[str, Any]:
+    """
+    Seat every group member, hall by hall in the given order.
+
+    Seats are filled row-major; each seat takes the largest remaining group
+    that differs from every already-filled neighbour (front, back and sides,
+    plus diagonals when `diagonal` is set). A seat with no eligible group is
+    left empty, unless `fill_blocked` is set and students are still waiting
+    once every hall has been walked: those then take the empty seats, largest
+    group first, and are counted in `forced`. `occupied` maps hall id ->
+    {seat: group} for seats that are already taken and must stay as they are.
+    New seats are recorded in the returned SeatPlan; students that do not fit
+    anywhere are returned in `unseated`.
+    """
+    occupied = occupied or {}
+    plan = SeatPlan(halls)
+
+    # Heap of (-remaining, insertion order, group key); order keeps ties stable
+    order = {key: i for i, key in enumerate(groups)}
+    cursors = {key: 0 for key in groups}
+    heap = [(-len(members), order[key], key) for key, members in groups.items() if members]
+    heapq.heapify(heap)
+
+    def take(position, seat, grid, counts, entry):
+        remaining, rank, key = entry
+        member = groups[key][cursors[key]]
+        cursors[key] += 1
+        grid[seat] = key
+        counts[key] = counts.get(key, 0) + 1
+        plan.place(position, seat, plan.add(member, key))
+        if remaining + 1 < 0:
+            heapq.heappush(heap, (remaining + 1, rank, key))
+
+    walked = []
+    for position, hall in enumerate(halls):
+        if not heap:
+            break
+
+        _, cols = hall_shape(hall)
+        usable = plan.capacity(position)
+        grid: List[Optional[Hashable]] = [None] * usable
+        for seat, key in occupied.get(hall.get("id"), {}).items():
+            if 0 <= seat < usable:
+                grid[seat] = key
+        counts: Dict[Hashable, int] = {}
+        walked.append((position, hall, cols, grid, counts))
+
+        for seat in range(usable):
+            if not heap:
+                break
+            if grid[seat] is not None:
+                continue
+
+            blocked = {grid[n] for n in neighbours(seat, cols, usable, diagonal)}
+
+            skipped = []
+            while heap and heap[0][2] in blocked:
+                skipped.append(heapq.heappop(heap))
+
+            if heap:
+                take(position, seat, grid, counts, heapq.heappop(heap))
+
+            for entry in skipped:
+                heapq.heappush(heap, entry)
+
+    # Every seat still empty was blocked for every waiting group
+    forced = 0
+    if fill_blocked:
+        for position, hall, cols, grid, counts in walked:
+            for seat in range(len(grid)):
+                if not heap:
+                    break
+                if grid[seat] is None:
+                    take(position, seat, grid, counts, heapq.heappop(heap))
+                    forced += 1
+
+    hall_summaries = [
+        {"hall": hall, "filled": sum(counts.values()), "groups": counts}
+        for _, hall, _, _, counts in walked
+    ]
+
+    unseated = [
+        {"group": key, "student": member}
+        for key, members in groups.items()
+        for member in members[cursors[key]:]
+    ]
+
+    return {"plan": plan, "halls": hall_summaries, "unseated": unseated, "forced": forced}
+
+
+def keep_existing_seats(
+    students: List[Dict[str, Any]],
+    halls: List[Dict[str, Any]],
+    group_of: Callable[[Dict[str, Any]], Hashable],
+) -> Tuple[Dict[Any, Dict[int, Hashable]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split students on their current hall_id/seat.
+
+    A seat is kept when its hall still exists, the seat index still fits the
+    hall, no earlier student already holds it and no kept neighbour is in
+    the same group (a student who changed group may now clash). Returns
+    (occupied map for assign_seats, kept students, students that need a new seat).
+    """
+    usable = {hall["id"]: usable_seats(hall) for hall in halls}
+    columns = {hall["id"]: hall_shape(hall)[1] for hall in halls}
+
+    occupied: Dict[Any, Dict[int, Hashable]] = {}
+    kept: List[Dict[str, Any]] = []
+    to_place: List[Dict[str, Any]] = []
+    for student in students:
+        hall_id, seat = student.get("hall_id"), student.get("seat")
+        if hall_id in usable and seat is not None and 0 <= seat < usable[hall_id]:
+            taken = occupied.setdefault(hall_id, {})
+            group = group_of(student)
+            around = neighbours(seat, columns[hall_id], usable[hall_id])
+            if seat not in taken and all(taken.get(n) != group for n in around):
+                taken[seat] = group
+                kept.append(student)
+                continue
+        to_place.append(student)
+    return occupied, kept, to_place
@@ -0,0 +1,146 @@
+"""
+Seating-plan validator: checks a finished SeatPlan for same-group neighbours,
+students seated twice, halls filled past capacity and candidates left without
+a seat. All seat checks are NumPy shifts over the plan's flat seat array, so a
+whole exam series validates in milliseconds.
+"""
+
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+from services.seat_plan import EMPTY, SeatPlan
+
+# Length of each "examples" list in a plan report
+MAX_EXAMPLES = 50
+
+# Each neighbouring pair is looked at once, from its upper/left seat
+ORTHOGONAL = ((0, 1), (1, 0))
+DIAGONAL = ((1, 1), (1, -1))
+
+
+def _seat_groups(plan: SeatPlan) -> np.ndarray:
+    """Integer group code per seat, EMPTY where nobody sits"""
+    codes: Dict[Hashable, int] = {}
+    per_student = np.fromiter((codes.setdefault(g, len(codes)) for g in plan.groups),
+                              dtype=np.int64, count=len(plan.groups))
+    # A trailing EMPTY makes seat value -1 pick EMPTY
+    return np.append(per_student, EMPTY)[plan.seats]
+
+
+def _neighbour_clashes(plan: SeatPlan, groups: np.ndarray, steps) -> List[Dict[str, Any]]:
+    """Pairs of neighbouring seats (one step of `steps` apart) holding the same group"""
+    capacities = np.diff(plan.offsets)
+    hall = np.repeat(np.arange(len(plan.halls)), capacities)
+    local = np.arange(len(plan.seats)) - plan.offsets[hall]
+    cols = plan.cols[hall]
+    row, col = local // cols, local % cols
+
+    clashes = []
+    for dr, dc in steps:
+        r, c = row + dr, col + dc
+        inside = (c >= 0) & (c < cols) & (r * cols + c < capacities[hall])
+        target = np.where(inside, plan.offsets[hall] + r * cols + c, 0)
+        clash = inside & (groups != EMPTY) & (groups == groups[target])
+        for seat, other in zip(np.flatnonzero(clash).tolist(), target[clash].tolist()):
+            position = int(hall[seat])
+            start = int(plan.offsets[position])
+            clashes.append({
+                "hall": plan.halls[position].get("name", plan.halls[position]["id"]),
+                "seat": seat - start,
+                "neighbour": other - start,
+                "group": plan.groups[int(plan.seats[seat])],
+            })
+    return clashes
+
+
+def validate_plan(plan: SeatPlan, key: Callable[[Any], Hashable] = lambda student: student,
+                  expected: Optional[Iterable[Hashable]] = None, diagonal: bool = False) -> Dict[str, Any]:
+    """
+    Check a plan. `key` identifies a student (e.g. its id), `expected` lists every
+    candidate that should hold a seat. Diagonal neighbours only count as violations
+    when `diagonal` is set; otherwise they are reported as a count.
+    """
+    started = time.perf_counter()
+    groups = _seat_groups(plan)
+
+    adjacent = _neighbour_clashes(plan, groups, ORTHOGONAL + (DIAGONAL if diagonal else ()))
+    diagonal_pairs = 0 if diagonal else len(_neighbour_clashes(plan, groups, DIAGONAL))
+
+    seated = plan.seats[plan.seats != EMPTY]
+    keys = [key(plan.students[i]) for i in seated.tolist()]
+    counts: Dict[Hashable, int] = {}
+    for k in keys:
+        counts[k] = counts.get(k, 0) + 1
+    double_booked = [k for k, n in counts.items() if n > 1]
+
+    over_capacity = []
+    assigned = plan.filled()
+    for _, position, reason in plan.rejected:
+        if position is not None:
+            assigned[position] += 1
+    for position in np.flatnonzero(assigned > np.diff(plan.offsets)).tolist():
+        hall = plan.halls[position]
+        over_capacity.append({"hall": hall.get("name", hall["id"]), "assigned": int(assigned[position]),
+                              "capacity": plan.capacity(position)})
+
+    rejected = [{"student": key(student), "reason": reason} for student, _, reason in plan.rejected]
+    unseated = [k for k in expected if k not in counts] if expected is not None else []
+
+    return {
+        "valid": not (adjacent or double_booked or over_capacity or rejected or unseated),
+        "seated": len(counts),
+        "adjacent": len(adjacent),
+        "diagonal": diagonal_pairs,
+        "doubleBooked": len(double_booked),
+        "overCapacity": len(over_capacity),
+        "rejected": len(rejected),
+        "unseated": len(unseated),
+        "examples": {
+            "adjacent": adjacent[:MAX_EXAMPLES],
+            "doubleBooked": double_booked[:MAX_EXAMPLES],
+            "overCapacity": over_capacity[:MAX_EXAMPLES],
+            "rejected": rejected[:MAX_EXAMPLES],
+            "unseated": unseated[:MAX_EXAMPLES],
+        },
+        "seconds": round(time.perf_counter() - started, 6),
+    }
+
+
+def summarize(reports: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totals over several validation reports, e.g. every slot of an exam series"""
+    reports = list(reports)
+    fields = ("seated", "adjacent", "diagonal", "doubleBooked", "overCapacity", "rejected", "unseated")
+    return {
+        "valid": all(r["valid"] for r in reports),
+        **{field: sum(r[field] for r in reports) for field in fields},
+        "seconds": round(sum(r["seconds"] for r in reports), 6),
+    }
+
+
+def status(report: Dict[str, Any]) -> str:
+    """
+    "success" for a clean report (or summary), "partial" when the plan may be
+    written but breaks adjacency or leaves candidates unseated, and "error"
+    when it seats someone twice, overfills a hall or holds unplaceable seats.
+    """
+    if report["valid"]:
+        return "success"
+    if report["doubleBooked"] or report["overCapacity"] or report["rejected"]:
+        return "error"
+    return "partial"
+
+
+def describe(report: Dict[str, Any]) -> str:
+    """One log line for a validation report"""
+    if report["valid"]:
+        return f"🛡️ Plan validated: {report['seated']} seated, no clashes ({report['seconds'] * 1000:.1f} ms)"
+    problems = [
+        f"{report[field]} {label}"
+        for field, label in (("adjacent", "adjacent same-group pairs"), ("doubleBooked", "double-booked students"),
+                             ("overCapacity", "over-capacity halls"), ("rejected", "unplaceable seats"),
+                             ("unseated", "unseated candidates"))
+        if report[field]
+    ]
+    return f"⚠️ Plan check failed: {', '.join(problems)}"
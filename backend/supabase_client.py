@@ -3,10 +3,23 @@ Supabase Client Module for GCE Erode Exam Seating System
 Handles all database operations via Supabase REST API
 """
 
+import contextvars
+import json
 import os
-from supabase import create_client, Client
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+import httpx
+from sqlalchemy import create_engine, text
+from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 
+from metrics import InstrumentedTransport
+from services.seat_plan import seat_position
+
 # Load environment variables
 load_dotenv()
 
@@ -17,21 +30,285 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_ANON_KEY")
 if not SUPABASE_KEY:
     raise ValueError("SUPABASE_KEY or SUPABASE_ANON_KEY environment variable is required")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Seconds before one Supabase call is abandoned, and extra attempts after a transient failure
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", "2"))
+
+# Keep-alive connections shared by every request thread
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+
+# Threads used to run independent queries side by side
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "8"))
+
+# Optional direct Postgres connection (on-prem); SQL functions then skip PostgREST
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# ======================= CONNECTION POOL =======================
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+class RetryTransport(httpx.BaseTransport):
+    """Retry transient failures with exponential backoff and jitter.
+
+    Requests that never reached the server (connect errors, pool timeouts) are
+    always retried; reads are also retried on timeouts and gateway errors.
+    """
+
+    def __init__(self, transport, retries=SUPABASE_RETRIES, backoff=0.2):
+        self._transport = transport
+        self.retries = retries
+        self.backoff = backoff
+
+    def _sleep(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def handle_request(self, req):
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self._transport.handle_request(req)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if last:
+                    raise
+            except httpx.TransportError:
+                if last or req.method not in IDEMPOTENT_METHODS:
+                    raise
+            else:
+                retry = response.status_code in RETRY_STATUSES and (
+                    req.method in IDEMPOTENT_METHODS or response.status_code == 503
+                )
+                if last or not retry:
+                    return response
+                response.close()
+            self._sleep(attempt)
+
+    def close(self):
+        self._transport.close()
+
+# Initialize Supabase client; every REST call goes through the pooled, retrying, metered transport
+_http_client = httpx.Client(
+    transport=RetryTransport(InstrumentedTransport(httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_POOL_SIZE,
+            keepalive_expiry=60,
+        ),
+    ))),
+    timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=min(SUPABASE_TIMEOUT, 5)),
+    follow_redirects=True,
+)
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(httpx_client=_http_client))
+
+# Pooled engine for the direct Postgres backend, with the same per-statement timeout
+pg_engine = create_engine(
+    DATABASE_URL,
+    pool_size=SUPABASE_POOL_SIZE,
+    pool_pre_ping=True,
+    connect_args={"options": f"-c statement_timeout={int(SUPABASE_TIMEOUT * 1000)}"},
+) if DATABASE_URL else None
+
+_fanout = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="supabase")
+
+def gather(*calls):
+    """Run independent zero-argument calls concurrently; results come back in call order.
+
+    Latency is that of the slowest call instead of the sum. The first error is re-raised.
+    """
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    futures = [_fanout.submit(contextvars.copy_context().run, call) for call in calls]
+    return [future.result() for future in futures]
+
+# Argument types of the SQL functions in supabase_schema.sql, for the direct Postgres backend
+RPC_ARG_TYPES = {"p_seats": "jsonb", "p_rows": "jsonb", "p_exam_ids": "integer[]"}
+
+def rpc(name, params=None):
+    """Call a SQL function: straight on Postgres when DATABASE_URL is set, else through PostgREST"""
+    params = params or {}
+    if pg_engine is None:
+        return supabase.rpc(name, params).execute().data
+
+    args = []
+    values = {}
+    for key, value in params.items():
+        sql_type = RPC_ARG_TYPES[key]
+        args.append(f"{key} => CAST(:{key} AS {sql_type})")
+        values[key] = json.dumps(value) if sql_type == "jsonb" else value
+    with pg_engine.begin() as conn:
+        return conn.execute(text(f"SELECT {name}({', '.join(args)})"), values).scalar()
+
+# Number of seat rows sent per bulk write request
+ALLOT_BATCH_SIZE = int(os.getenv("ALLOT_BATCH_SIZE", "500"))
+
+# Seconds reference data (departments, blocks, halls, exam dates) is served from memory
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+
+# Rows fetched per request when streaming exports
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+# Maximum number of cached helper results; keys include request arguments such as ?date=
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+
+# Maximum number of reg_no -> seat card entries kept for /api/search
+SEAT_CARD_CACHE_SIZE = int(os.getenv("SEAT_CARD_CACHE_SIZE", "20000"))
+
+# Subject codes per in.() filter, so a whole exam series cannot overflow the request URL
+SUBJECT_FILTER_CHUNK = 100
+
+# ======================= CACHE =======================
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _store(key, expires, value, now):
+    """Add a cache entry after purging expired ones, evicting the oldest past CACHE_MAX_ENTRIES"""
+    for stale in [k for k, (until, _) in _cache.items() if until <= now]:
+        del _cache[stale]
+    _cache.pop(key, None)
+    while _cache and len(_cache) >= CACHE_MAX_ENTRIES:
+        del _cache[next(iter(_cache))]
+    _cache[key] = (expires, value)
+
+def cached(name):
+    """Memoize a read-only helper per argument set for CACHE_TTL seconds"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (name, func.__name__, args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+            with _cache_lock:
+                entry = _cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+            value = func(*args, **kwargs)
+            with _cache_lock:
+                _store(key, now + CACHE_TTL, value, now)
+            return value
+        return wrapper
+    return decorator
+
+def invalidate_cache(*names):
+    """Drop cached entries for the given helper names, or everything when none are given"""
+    with _cache_lock:
+        if not names:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] in names]:
+            del _cache[key]
+
+class SeatCardCache:
+    """Size-bounded LRU map of reg_no -> seat card with hit/miss counters.
+
+    Cards expire `ttl` seconds after the rows they were built from were read,
+    so instances that did not run an allotment stop serving old seats.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, reg_no):
+        with self._lock:
+            entry = self._cards.get(reg_no)
+            if entry and entry[1] + self.ttl <= time.monotonic():
+                del self._cards[reg_no]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._cards.move_to_end(reg_no)
+            self.hits += 1
+            return entry[0]
+
+    def update(self, cards, read_at=None):
+        """Store cards built from rows read at `read_at` (default: now); newer cards are kept"""
+        read_at = time.monotonic() if read_at is None else read_at
+        with self._lock:
+            for card in cards:
+                current = self._cards.get(card["regNo"])
+                if current and current[1] > read_at:
+                    continue
+                self._cards[card["regNo"]] = (card, read_at)
+                self._cards.move_to_end(card["regNo"])
+            while len(self._cards) > self.max_size:
+                self._cards.popitem(last=False)
+
+    def retain(self, reg_nos):
+        """Drop cards for students outside `reg_nos`, e.g. removed from the roster"""
+        reg_nos = set(reg_nos)
+        with self._lock:
+            for reg_no in [r for r in self._cards if r not in reg_nos]:
+                del self._cards[reg_no]
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._cards),
+            "maxSize": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+seat_cards = SeatCardCache(SEAT_CARD_CACHE_SIZE, CACHE_TTL)
 
 # ======================= HELPER FUNCTIONS =======================
 
+def fetch_all_rows(table, columns="*", page_size=1000):
+    """Fetch every row of a table, paging past the PostgREST row limit"""
+    rows = []
+    offset = 0
+    while True:
+        response = supabase.table(table).select(columns).order("id").range(offset, offset + page_size - 1).execute()
+        rows.extend(response.data)
+        if len(response.data) < page_size:
+            return rows
+        offset += page_size
+
+def iter_keyset(table, columns, keys, prepare=None, page_size=None):
+    """Yield rows ordered by two key columns, fetching one keyset page per request.
+
+    `prepare` may add filters to each page query; the key pair must be unique.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    first, second = keys
+    last = None
+    while True:
+        query = supabase.table(table).select(columns)
+        if prepare:
+            query = prepare(query)
+        if last:
+            query = query.or_(f"{first}.gt.{last[0]},and({first}.eq.{last[0]},{second}.gt.{last[1]})")
+        page = query.order(first).order(second).limit(page_size).execute().data
+        yield from page
+        if len(page) < page_size:
+            return
+        last = (page[-1][first], page[-1][second])
+
+@cached("departments")
 def get_departments():
     """Fetch all departments"""
     response = supabase.table("departments").select("*").execute()
     return response.data
 
+@cached("blocks")
 def get_blocks():
     """Fetch all blocks with their halls"""
     response = supabase.table("blocks").select("*, halls(*)").execute()
     return response.data
 
+@cached("halls")
 def get_halls(block_key=None):
     """Fetch halls, optionally filtered by block"""
     query = supabase.table("halls").select("*, blocks(*)")
@@ -40,14 +317,47 @@ def get_halls(block_key=None):
     response = query.execute()
     return response.data
 
-def get_students(department_id=None, year_of_study=None, limit=100, offset=0):
-    """Fetch students with optional filters"""
-    query = supabase.table("students").select("*, departments(*), halls(*)")
+# Column sets for /api/students; narrower projections skip unused embeds
+STUDENT_FIELDS = {
+    "full": "*, departments(*), halls(*)",
+    "list": "id, reg_no, roll_no, name, department_id, year_of_study, seat, seat_label, departments(abbr, color), halls(name)",
+    "basic": "id, reg_no, roll_no, name, department_id, year_of_study, hall_id, seat, seat_label",
+}
+
+def get_students(department_id=None, year_of_study=None, limit=100, offset=0, after=None,
+                 hall_id=None, exam_ids=None, roll_prefix=None, name=None, fields="list"):
+    """Fetch students ordered by (department_id, id) with optional filters.
+
+    Pass `after` = (department_id, id) of the last row seen for keyset paging;
+    `offset` is only used without it.
+    """
+    columns = STUDENT_FIELDS.get(fields, STUDENT_FIELDS["list"])
+    if exam_ids is not None:
+        if not exam_ids:
+            return []
+        columns += ", allotments!inner(exam_id)"
+    
+    query = supabase.table("students").select(columns)
     if department_id:
         query = query.eq("department_id", department_id)
     if year_of_study:
         query = query.eq("year_of_study", year_of_study)
-    response = query.range(offset, offset + limit - 1).execute()
+    if hall_id:
+        query = query.eq("hall_id", hall_id)
+    if exam_ids:
+        query = query.in_("allotments.exam_id", exam_ids)
+    if roll_prefix:
+        query = query.like("roll_no", f"{roll_prefix}%")
+    if name:
+        query = query.ilike("name", f"%{name}%")
+    query = query.order("department_id").order("id")
+    
+    if after:
+        dept_id, student_id = after
+        query = query.or_(f"department_id.gt.{dept_id},and(department_id.eq.{dept_id},id.gt.{student_id})")
+        response = query.limit(limit).execute()
+    else:
+        response = query.range(offset, offset + limit - 1).execute()
     return response.data
 
 def search_student(reg_no):
@@ -57,6 +367,51 @@ def search_student(reg_no):
     ).eq("reg_no", reg_no).single().execute()
     return response.data
 
+def seat_card(student):
+    """Format a student row with departments and halls(blocks) embeds as a public seat card"""
+    dept = student.get("departments") or {}
+    hall = student.get("halls") or {}
+    block = hall.get("blocks") or {}
+    
+    row, col = seat_position(student.get("seat"), hall.get("cols") if hall else None)
+    
+    return {
+        "regNo": student["reg_no"],
+        "rollNo": student["roll_no"],
+        "name": student["name"],
+        "department": dept.get("abbr") if dept else None,
+        "color": dept.get("color", "gray") if dept else "gray",
+        "yearOfStudy": student["year_of_study"],
+        "hall": hall.get("name") if hall else None,
+        "block": block.get("name") if block else None,
+        "blockKey": block.get("key") if block else None,
+        "seat": student["seat"],
+        "row": row,
+        "col": col,
+        "seatCode": f"R{row}C{col}" if row and col else None
+    }
+
+def lookup_seat_card(reg_no):
+    """Return (seat card or None, served from cache) for a registration number"""
+    card = seat_cards.get(reg_no)
+    if card:
+        return card, True
+    read_at = time.monotonic()
+    student = search_student(reg_no)
+    if not student:
+        return None, False
+    card = seat_card(student)
+    seat_cards.update([card], read_at)
+    return card, False
+
+def warm_seat_cards():
+    """Load every student's seat card into the lookup cache"""
+    # Cards patched by an allotment while this read runs are newer and win
+    read_at = time.monotonic()
+    students = fetch_all_rows("students", "*, departments(*), halls(*, blocks(*))")
+    seat_cards.update((seat_card(s) for s in students), read_at)
+    return len(students)
+
 def get_hall_seats(hall_id):
     """Get all students seated in a specific hall"""
     response = supabase.table("students").select(
@@ -64,19 +419,25 @@ def get_hall_seats(hall_id):
     ).eq("hall_id", hall_id).order("seat").execute()
     return response.data
 
+HALL_SEATS_COLUMNS = "id, name, capacity, rows, cols, blocks!inner(key, name), students(id, reg_no, roll_no, name, seat, departments(abbr, color))"
+
+def get_hall_with_seats(hall_name):
+    """Fetch a hall together with its seated students in one embedded query"""
+    response = supabase.table("halls").select(HALL_SEATS_COLUMNS).eq("name", hall_name).execute()
+    return response.data[0] if response.data else None
+
+def get_halls_with_seats(block_key=None):
+    """Fetch every hall (optionally one block) with its seated students in one embedded query"""
+    query = supabase.table("halls").select(HALL_SEATS_COLUMNS)
+    if block_key:
+        query = query.eq("blocks.key", block_key)
+    response = query.order("id").execute()
+    return response.data
+
+@cached("stats")
 def get_stats():
-    """Get dashboard statistics"""
-    students = supabase.table("students").select("id", count="exact").execute()
-    halls = supabase.table("halls").select("id", count="exact").execute()
-    departments = supabase.table("departments").select("id", count="exact").execute()
-    allocated = supabase.table("students").select("id", count="exact").neq("hall_id", None).execute()
-    
-    return {
-        "totalStudents": students.count,
-        "totalHalls": halls.count,
-        "totalDepartments": departments.count,
-        "allocatedSeats": allocated.count
-    }
+    """Get dashboard statistics, including per-block and per-department fill, in one call"""
+    return rpc("dashboard_stats")
 
 def allocate_seat(student_id, hall_id, seat_number, seat_label=None):
     """Allocate a seat to a student"""
@@ -88,6 +449,54 @@ def allocate_seat(student_id, hall_id, seat_number, seat_label=None):
     response = supabase.table("students").update(update_data).eq("id", student_id).execute()
     return response.data
 
+def bulk_allocate_seats(seats, batch_size=None):
+    """Write many seat allocations through the allocate_seats RPC, one call per chunk.
+
+    Each item is a dict with id, hall_id, seat and seat_label.
+    Returns the number of requests issued.
+    """
+    batch_size = max(1, batch_size or ALLOT_BATCH_SIZE)
+    requests_made = 0
+    for start in range(0, len(seats), batch_size):
+        chunk = seats[start:start + batch_size]
+        rpc("allocate_seats", {"p_seats": chunk})
+        requests_made += 1
+    return requests_made
+
+def upsert_students(records, columns=None):
+    """Insert or update a batch of students keyed on reg_no (seat columns are left alone).
+
+    With `columns`, students that already exist only have those columns changed:
+    their other stored values are read back and written over the incoming record,
+    and a name of None keeps the stored name. New students without a name are not
+    written; their reg_nos are returned.
+    """
+    skipped = []
+    if columns is not None:
+        keep = [c for c in records[0] if c not in ("reg_no", "name") and c not in columns]
+        existing = {}
+        for start in range(0, len(records), 500):
+            reg_nos = [r["reg_no"] for r in records[start:start + 500]]
+            response = supabase.table("students").select(", ".join(["reg_no", "name", *keep])).in_("reg_no", reg_nos).execute()
+            existing.update((row["reg_no"], row) for row in response.data)
+
+        merged = []
+        for record in records:
+            stored = existing.get(record["reg_no"])
+            if stored is None:
+                if record["name"] is None:
+                    skipped.append(record["reg_no"])
+                else:
+                    merged.append(record)
+                continue
+            if "name" not in columns or record["name"] is None:
+                record = {**record, "name": stored["name"]}
+            merged.append({**record, **{c: stored[c] for c in keep}})
+        records = merged
+    if records:
+        supabase.table("students").upsert(records, on_conflict="reg_no", returning="minimal").execute()
+    return skipped
+
 def clear_all_allocations():
     """Clear all seat allocations"""
     response = supabase.table("students").update({
@@ -97,6 +506,64 @@ def clear_all_allocations():
     }).neq("id", 0).execute()  # Update all rows
     return response.data
 
+def iter_subject_registrations(subject_codes):
+    """Yield (subject_code, student_id) rows from student_subjects for the given subjects.
+
+    Codes are walked in sorted chunks, so rows still come in (subject_code, student_id) order.
+    """
+    codes = sorted(set(subject_codes))
+    for start in range(0, len(codes), SUBJECT_FILTER_CHUNK):
+        chunk = codes[start:start + SUBJECT_FILTER_CHUNK]
+        yield from iter_keyset(
+            "student_subjects",
+            "subject_code, student_id",
+            ("subject_code", "student_id"),
+            prepare=lambda q, chunk=chunk: q.in_("subject_code", chunk),
+            page_size=1000,
+        )
+
+def iter_seat_rows(slots=False, date=None, session=None):
+    """Yield seated students ordered by slot, hall and seat (0-based).
+
+    By default this walks the campus seating on the students table; with
+    `slots` it walks the per-exam allotments, optionally for one date/session.
+    """
+    if not slots:
+        for row in iter_keyset(
+            "students",
+            "hall_id, seat, reg_no, roll_no, name, departments(abbr)",
+            ("hall_id", "seat"),
+            prepare=lambda q: q.not_.is_("hall_id", "null").not_.is_("seat", "null"),
+        ):
+            yield row
+        return
+
+    for slot in get_unique_exam_dates():
+        if date and slot["date"] != date:
+            continue
+        if session and slot["session"] != session:
+            continue
+        exams = {e["id"]: e for e in get_exams(slot["date"], slot["session"])}
+        for row in iter_keyset(
+            "allotments",
+            "hall_id, seat_number, exam_id, students(reg_no, roll_no, name, departments(abbr))",
+            ("hall_id", "seat_number"),
+            prepare=lambda q: q.in_("exam_id", list(exams)),
+        ):
+            yield {
+                **row["students"],
+                "hall_id": row["hall_id"],
+                "seat": row["seat_number"] - 1,
+                "date": slot["date"],
+                "session": slot["session"],
+                "subject_code": exams[row["exam_id"]]["subject_code"],
+            }
+
+def replace_allotments(exam_ids, rows):
+    """Swap the allotments of the given exams for new rows in one transaction"""
+    return rpc("replace_allotments", {"p_exam_ids": exam_ids, "p_rows": rows})
+
+@cached("exams")
 def get_exams(date=None, session=None):
     """Fetch exams with optional date/session filter"""
     query = supabase.table("exams").select("*")
@@ -107,6 +574,7 @@ def get_exams(date=None, session=None):
     response = query.execute()
     return response.data
 
+@cached("exams")
 def get_unique_exam_dates():
     """Get unique exam dates for the dropdown"""
     response = supabase.table("exams").select("date, session").execute()
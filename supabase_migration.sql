@@ -0,0 +1,170 @@
+-- GCE Erode Exam Hall Seating System - in-place migration for Supabase
+-- Brings a database created from an older supabase_schema.sql up to date
+-- without dropping any table. Every statement is safe to re-run.
+-- Run this in the Supabase SQL Editor
+
+BEGIN;
+
+-- ======================= SCHEMA =======================
+
+-- Seat grid; seats are numbered row-major, rows default to ceil(capacity / cols)
+ALTER TABLE halls ADD COLUMN IF NOT EXISTS rows INTEGER;
+ALTER TABLE halls ADD COLUMN IF NOT EXISTS cols INTEGER DEFAULT 5;
+
+-- Student subject registrations (normalized form of students.subjects_registered)
+CREATE TABLE IF NOT EXISTS student_subjects (
+    student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+    subject_code VARCHAR(20) NOT NULL,
+    PRIMARY KEY (student_id, subject_code)
+);
+
+-- ======================= INDEXES =======================
+
+-- idx_students_department used to cover department_id alone; keyset paging needs (department_id, id)
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE indexname = 'idx_students_department' AND indexdef NOT LIKE '%(department_id, id)%'
+    ) THEN
+        DROP INDEX idx_students_department;
+    END IF;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_students_reg_no ON students(reg_no);
+CREATE INDEX IF NOT EXISTS idx_students_department ON students(department_id, id);
+CREATE INDEX IF NOT EXISTS idx_students_roll_no ON students(roll_no varchar_pattern_ops);
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_students_name_trgm ON students USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_students_hall ON students(hall_id);
+CREATE INDEX IF NOT EXISTS idx_halls_block ON halls(block_id);
+CREATE INDEX IF NOT EXISTS idx_allotments_student ON allotments(student_id);
+CREATE INDEX IF NOT EXISTS idx_allotments_exam ON allotments(exam_id);
+CREATE INDEX IF NOT EXISTS idx_student_subjects_subject ON student_subjects(subject_code, student_id);
+CREATE INDEX IF NOT EXISTS idx_exams_subject ON exams(subject_code);
+
+-- ======================= FUNCTIONS =======================
+
+-- Bulk seat write used by /api/allot: one call updates a whole chunk of students
+CREATE OR REPLACE FUNCTION allocate_seats(p_seats JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE students s
+        SET hall_id = x.hall_id,
+            seat = x.seat,
+            seat_label = x.seat_label
+        FROM jsonb_to_recordset(p_seats) AS x(id INTEGER, hall_id INTEGER, seat INTEGER, seat_label VARCHAR(20))
+        WHERE s.id = x.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
+
+-- Dual-write during the move off subjects_registered: any insert/update of the
+-- comma-separated column rewrites that student's student_subjects rows
+CREATE OR REPLACE FUNCTION sync_student_subjects()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    DELETE FROM student_subjects WHERE student_id = NEW.id;
+    INSERT INTO student_subjects (student_id, subject_code)
+    SELECT DISTINCT NEW.id, TRIM(code)
+    FROM unnest(string_to_array(COALESCE(NEW.subjects_registered, ''), ',')) AS code
+    WHERE TRIM(code) <> '';
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_sync_student_subjects ON students;
+CREATE TRIGGER trg_sync_student_subjects
+AFTER INSERT OR UPDATE OF subjects_registered ON students
+FOR EACH ROW EXECUTE FUNCTION sync_student_subjects();
+
+-- Backfill for rows loaded before the trigger existed (safe to re-run)
+CREATE OR REPLACE FUNCTION backfill_student_subjects()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    INSERT INTO student_subjects (student_id, subject_code)
+    SELECT DISTINCT s.id, TRIM(code)
+    FROM students s, unnest(string_to_array(s.subjects_registered, ',')) AS code
+    WHERE TRIM(code) <> ''
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- Dashboard counters for /api/stats in a single round trip
+CREATE OR REPLACE FUNCTION dashboard_stats()
+RETURNS JSON
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT json_build_object(
+        'totalStudents', (SELECT COUNT(*) FROM students),
+        'totalHalls', (SELECT COUNT(*) FROM halls),
+        'totalDepartments', (SELECT COUNT(*) FROM departments),
+        'allocatedSeats', (SELECT COUNT(*) FROM students WHERE hall_id IS NOT NULL),
+        'blocks', COALESCE((
+            SELECT json_agg(json_build_object(
+                'key', b.key, 'name', b.name, 'capacity', b.capacity, 'filled', b.filled
+            ) ORDER BY b.id)
+            FROM (
+                SELECT bl.id, bl.key, bl.name,
+                       COALESCE(SUM(h.capacity), 0) AS capacity,
+                       COALESCE(SUM(h.filled), 0) AS filled
+                FROM blocks bl
+                LEFT JOIN (
+                    SELECT hl.id, hl.block_id, hl.capacity, COUNT(s.id) AS filled
+                    FROM halls hl
+                    LEFT JOIN students s ON s.hall_id = hl.id
+                    GROUP BY hl.id
+                ) h ON h.block_id = bl.id
+                GROUP BY bl.id
+            ) b
+        ), '[]'::json),
+        'departments', COALESCE((
+            SELECT json_agg(json_build_object(
+                'abbr', d.abbr, 'total', d.total, 'allocated', d.allocated
+            ) ORDER BY d.id)
+            FROM (
+                SELECT dp.id, dp.abbr, COUNT(s.id) AS total, COUNT(s.hall_id) AS allocated
+                FROM departments dp
+                LEFT JOIN students s ON s.department_id = dp.id
+                GROUP BY dp.id
+            ) d
+        ), '[]'::json)
+    );
+$$;
+
+-- Per-slot allotment write used by /api/allot?mode=slots: delete + insert in one transaction
+CREATE OR REPLACE FUNCTION replace_allotments(p_exam_ids INTEGER[], p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    inserted INTEGER;
+BEGIN
+    DELETE FROM allotments WHERE exam_id = ANY(p_exam_ids);
+    INSERT INTO allotments (student_id, exam_id, hall_id, seat_number)
+    SELECT x.student_id, x.exam_id, x.hall_id, x.seat_number
+    FROM jsonb_to_recordset(p_rows) AS x(student_id INTEGER, exam_id INTEGER, hall_id INTEGER, seat_number INTEGER);
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- ======================= BACKFILL =======================
+
+-- Registrations for students loaded before the trigger existed
+SELECT backfill_student_subjects();
+
+COMMIT;